@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the Gmail, Calendar and Overleaf helpers.
+
+Google API traffic is replayed from the recorded responses in fixtures/ through
+a googleapiclient HttpMock, with an optional injected latency per round trip.
+Overleaf scenarios run against a local bare git repository standing in for
+git.overleaf.com. No network access or real account is needed.
+
+For each scenario this reports wall time, upstream round trips (HTTP requests
+or git subprocesses) and peak Python heap usage.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --latency 80 --only gmail
+"""
+
+import argparse
+import copy
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+
+# Add repository root to path for imports
+BENCH_DIR = Path(__file__).parent.absolute()
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpMock
+
+import calendar_store
+import google_utils
+import mail_store
+import metrics
+import overleaf_utils
+import quota
+
+FIXTURES = BENCH_DIR / "fixtures"
+
+
+# ───── Google API replay ─────
+
+class ReplayHttp(HttpMock):
+    """
+    HttpMock that answers Gmail and Calendar requests from recorded fixtures.
+
+    Responses are picked by URL rather than by call order, because listing
+    prefetch and multi-calendar fetches issue requests from several threads.
+    Every request sleeps for `latency` seconds and is counted as a round trip.
+    """
+
+    def __init__(self, message_count=0, event_count=0, latency=0.0, page_size=100):
+        super().__init__()
+        self.latency = latency
+        self.page_size = page_size
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self._message = json.loads((FIXTURES / "gmail_message.json").read_text())
+        self._event = json.loads((FIXTURES / "calendar_event.json").read_text())
+        self.message_ids = [f"{int(self._message['id'], 16) + i:x}" for i in range(message_count)]
+        self.event_count = event_count
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=1, connection_type=None):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(uri)
+        query = parse_qs(url.query)
+        if url.path.endswith(("/batch", "/batch/gmail/v1")):
+            return self._batch(body)
+        if url.path.endswith("/profile"):
+            return self._json({"emailAddress": "me@example.org", "historyId": "9876543"})
+        if url.path.endswith("/history"):
+            return self._json({"historyId": "9876543"})
+        if url.path.endswith("/messages"):
+            return self._json(self._page(self.message_ids, query, "messages", lambda i: {"id": i, "threadId": i}))
+        if "/messages/" in url.path:
+            return self._json(self._get_message(url.path.rsplit("/", 1)[1], query))
+        if url.path.endswith("/events"):
+            page = self._page(list(range(self.event_count)), query, "items", self._get_event)
+            if "nextPageToken" not in page:
+                page["nextSyncToken"] = "sync-1"
+            return self._json(page)
+        return httplib2.Response({"status": "404"}), b'{"error": {"code": 404, "message": "not recorded"}}'
+
+    @staticmethod
+    def _json(data):
+        return httplib2.Response({"status": "200", "content-type": "application/json"}), json.dumps(data).encode()
+
+    def _page(self, items, query, key, render):
+        start = int(query.get("pageToken", ["0"])[0])
+        size = min(int(query.get("maxResults", [self.page_size])[0]), self.page_size)
+        page = {key: [render(i) for i in items[start:start + size]]}
+        if start + size < len(items):
+            page["nextPageToken"] = str(start + size)
+        return page
+
+    def _get_message(self, msg_id, query):
+        msg = copy.deepcopy(self._message)
+        msg["id"] = msg["threadId"] = msg_id
+        if query.get("format", ["full"])[0] == "metadata":
+            wanted = set(query.get("metadataHeaders", []))
+            msg["payload"] = {
+                "mimeType": msg["payload"]["mimeType"],
+                "headers": [h for h in msg["payload"]["headers"] if h["name"] in wanted],
+            }
+        return msg
+
+    def _get_event(self, i):
+        event = copy.deepcopy(self._event)
+        event["id"] = f"{event['id']}{i:05d}"
+        day = time.gmtime(time.mktime((2026, 10, 1, 12, 0, 0, 0, 0, -1)) + 3600 * 5 * i)
+        event["start"]["dateTime"] = time.strftime("%Y-%m-%dT%H:00:00+00:00", day)
+        event["end"]["dateTime"] = time.strftime("%Y-%m-%dT%H:45:00+00:00", day)
+        return event
+
+    def _batch(self, body):
+        boundary = "batch_replay"
+        parts = []
+        for block in body.split("Content-ID: ")[1:]:
+            content_id = block.split("\n", 1)[0].strip()
+            request_line = next(line for line in block.splitlines() if line.startswith("GET "))
+            request_url = urlparse(request_line.split(" ")[1])
+            msg = self._get_message(request_url.path.rsplit("/", 1)[1], parse_qs(request_url.query))
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{json.dumps(msg)}\r\n"
+            )
+        payload = "".join(parts) + f"--{boundary}--"
+        return httplib2.Response({"status": "200", "content-type": f"multipart/mixed; boundary={boundary}"}), payload.encode()
+
+
+def _install_replay(http, workdir):
+    """Point google_utils and the local stores at the replay transport and a scratch directory."""
+    services = {
+        ("gmail", "v1"): build("gmail", "v1", http=http, requestBuilder=google_utils._TimedHttpRequest),
+        ("calendar", "v3"): build("calendar", "v3", http=http, requestBuilder=google_utils._TimedHttpRequest),
+    }
+    google_utils.get_google_service = lambda api_name, version: services[(api_name, version)]
+    # The replay has no quota to protect, so measure the helpers rather than the pacing
+    quota._buckets.clear()
+    mail_store._store = mail_store.MailStore(workdir / "mail.sqlite3")
+    calendar_store._store = calendar_store.CalendarStore(workdir / "calendar.sqlite3")
+
+
+# ───── Overleaf replay ─────
+
+def _setup_overleaf(workdir):
+    """Create a bare 'remote' with a small project and register it in a scratch config."""
+    remote = workdir / "remote.git"
+    seed = workdir / "seed"
+    overleaf_utils._run_git(["init", "--bare", "-q", str(remote)])
+    overleaf_utils._run_git(["clone", "-q", str(remote), str(seed)])
+    (seed / "main.tex").write_text("\\documentclass{article}\n\\begin{document}\nHello\n\\end{document}\n")
+    for args in (["add", "-A"], ["-c", "user.name=bench", "-c", "user.email=bench@example.org",
+                                 "commit", "-q", "-m", "init"], ["push", "-q", "origin", "HEAD"]):
+        overleaf_utils._run_git(args, cwd=seed)
+
+    overleaf_utils._SCRIPT_DIR = workdir
+    overleaf_utils.CONFIG_PATH = workdir / "overleaf_config.json"
+    overleaf_utils.get_git_url = lambda project_id, config: str(remote)
+    overleaf_utils.save_config({
+        "credentials": {"email": "bench@example.org", "password": "x"},
+        "projects": {"bench": {"project_id": "bench", "local_path": "overleaf/bench"}},
+    })
+    project = workdir / "overleaf" / "bench"
+    return project
+
+
+def _git_identity(project):
+    overleaf_utils._run_git(["config", "user.name", "bench"], cwd=project)
+    overleaf_utils._run_git(["config", "user.email", "bench@example.org"], cwd=project)
+
+
+# ───── Scenarios ─────
+
+def scenario_list_emails(count, include_body):
+    def setup(workdir, latency):
+        http = ReplayHttp(message_count=count, latency=latency, page_size=500)
+        _install_replay(http, workdir)
+        return http
+
+    def run(http):
+        if count <= 500:
+            emails = google_utils.list_emails(query="is:unread", max_results=count, include_body=include_body)
+        else:
+            emails = list(google_utils.iter_emails(query="is:unread", page_size=500, include_body=include_body))
+        assert len(emails) == count, len(emails)
+
+    mode = "full" if include_body else "metadata"
+    return f"gmail: list {count} messages ({mode})", setup, run
+
+
+def scenario_list_emails_warm(count):
+    def setup(workdir, latency):
+        http = ReplayHttp(message_count=count, latency=latency, page_size=500)
+        _install_replay(http, workdir)
+        google_utils.list_emails(max_results=count, include_body=False)
+        http.round_trips = 0
+        return http
+
+    def run(http):
+        google_utils.list_emails(max_results=count, include_body=False)
+
+    return f"gmail: list {count} messages (warm cache)", setup, run
+
+
+def scenario_calendar(event_count, days):
+    def setup(workdir, latency):
+        http = ReplayHttp(event_count=event_count, latency=latency, page_size=250)
+        _install_replay(http, workdir)
+        return http
+
+    def run(http):
+        google_utils.get_events_between_dates("2026-10-01", f"2026-10-{days:02d}", calendar_ids="primary")
+
+    return f"calendar: {days}-day window, {event_count} events (cold)", setup, run
+
+
+def scenario_overleaf_push(file_count):
+    def setup(workdir, latency):
+        project = _setup_overleaf(workdir)
+        overleaf_utils.clone_or_pull("bench")
+        _git_identity(project)
+        return None
+
+    def run(_):
+        for i in range(file_count):
+            overleaf_utils.write_file("bench", f"sections/section_{i:03d}.tex", f"\\section{{Part {i}}}\n" * 20)
+        result = overleaf_utils.commit_and_push("bench", f"Add {file_count} files")
+        assert result.startswith("Changes pushed"), result
+
+    return f"overleaf: write + push {file_count} files", setup, run
+
+
+def scenario_overleaf_noop_push(file_count):
+    def content(i):
+        return f"\\section{{Part {i}}}\n" * 20
+
+    def setup(workdir, latency):
+        project = _setup_overleaf(workdir)
+        overleaf_utils.clone_or_pull("bench")
+        _git_identity(project)
+        for i in range(file_count):
+            overleaf_utils.write_file("bench", f"sections/section_{i:03d}.tex", content(i))
+        overleaf_utils.commit_and_push("bench", "Add files")
+        return None
+
+    def run(_):
+        for i in range(file_count):
+            overleaf_utils.write_file("bench", f"sections/section_{i:03d}.tex", content(i))
+        result = overleaf_utils.commit_and_push("bench", "No-op")
+        assert result == "No changes to commit", result
+
+    return f"overleaf: rewrite {file_count} unchanged files + push", setup, run
+
+
+def scenario_overleaf_list(file_count):
+    def setup(workdir, latency):
+        project = _setup_overleaf(workdir)
+        overleaf_utils.clone_or_pull("bench")
+        _git_identity(project)
+        for i in range(file_count):
+            overleaf_utils.write_file("bench", f"data/run_{i:04d}.csv", "x,y\n" * 50)
+        overleaf_utils.commit_and_push("bench", "Add data")
+        overleaf_utils.list_files("bench")
+        return None
+
+    def run(_):
+        for _ in range(20):
+            files = overleaf_utils.list_files("bench", extensions=["tex"])
+        assert files == ["main.tex"], files
+
+    return f"overleaf: list {file_count} files x20 (warm)", setup, run
+
+
+def scenario_overleaf_clone():
+    def setup(workdir, latency):
+        _setup_overleaf(workdir)
+        return None
+
+    def run(_):
+        result = overleaf_utils.clone_or_pull("bench")
+        assert result.startswith("Cloned"), result
+
+    return "overleaf: clone project", setup, run
+
+
+SCENARIOS = [
+    scenario_list_emails(10, include_body=True),
+    scenario_list_emails(10, include_body=False),
+    scenario_list_emails(100, include_body=True),
+    scenario_list_emails(100, include_body=False),
+    scenario_list_emails(1000, include_body=False),
+    scenario_list_emails_warm(100),
+    scenario_calendar(500, 14),
+    scenario_overleaf_clone(),
+    scenario_overleaf_push(200),
+    scenario_overleaf_noop_push(200),
+    scenario_overleaf_list(2000),
+]
+
+
+def run_scenario(name, setup, run, latency):
+    workdir = Path(tempfile.mkdtemp(prefix="alfred-bench-"))
+    try:
+        http = setup(workdir, latency)
+        metrics.reset()
+        tracemalloc.start()
+        start = time.perf_counter()
+        run(http)
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if http is not None:
+            trips = http.round_trips
+        else:
+            trips = sum(row["count"] for row in metrics.snapshot() if row["kind"] == "git")
+        return {"name": name, "wall_ms": 1000 * wall, "round_trips": trips, "peak_kb": peak / 1024}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run offline Alfred benchmarks.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Injected latency per Google API round trip, in milliseconds")
+    parser.add_argument("--only", default="", help="Run only scenarios whose name contains this text")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for name, setup, run in SCENARIOS:
+        if args.only and args.only not in name:
+            continue
+        results.append(run_scenario(name, setup, run, args.latency / 1000))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'scenario':<48} {'wall ms':>10} {'round trips':>12} {'peak KiB':>10}")
+    for r in results:
+        print(f"{r['name']:<48} {r['wall_ms']:>10.1f} {r['round_trips']:>12} {r['peak_kb']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Local SQLite event store for the Calendar tools.
+
+Each calendar is fully listed once, then kept current with incremental
+events().list(syncToken=...) calls. When Google expires a sync token (HTTP 410)
+the calendar is dropped from the store and listed again from scratch.
+"""
+
+import bisect
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from googleapiclient.errors import HttpError
+
+_SCRIPT_DIR = Path(__file__).parent.absolute()
+STORE_PATH = _SCRIPT_DIR / "memory" / "calendar_cache.sqlite3"
+
+# Seconds after a sync during which the store is trusted as-is
+SYNC_INTERVAL = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    summary TEXT,
+    start TEXT,
+    end TEXT,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    raw TEXT,
+    PRIMARY KEY (calendar_id, id)
+);
+CREATE INDEX IF NOT EXISTS events_start ON events(calendar_id, start_ts);
+CREATE TABLE IF NOT EXISTS sync_state (
+    calendar_id TEXT PRIMARY KEY,
+    sync_token TEXT
+);
+"""
+
+
+def to_timestamp(value: str) -> float:
+    """Convert an RFC 3339 dateTime or an all-day YYYY-MM-DD date to a UTC timestamp."""
+    if len(value) == 10:
+        return datetime.datetime.fromisoformat(value).replace(tzinfo=datetime.timezone.utc).timestamp()
+    dt = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+def _event_times(event: dict):
+    start = event.get("start", {})
+    end = event.get("end", {})
+    return start.get("dateTime", start.get("date", "")), end.get("dateTime", end.get("date", ""))
+
+
+class CalendarStore:
+    """On-disk event store keyed by (calendar_id, event_id)."""
+
+    def __init__(self, path=STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._last_sync = {}
+        self._sync_locks = {}
+
+    def _upsert(self, calendar_id: str, event: dict) -> None:
+        if event.get("status") == "cancelled":
+            self._conn.execute(
+                "DELETE FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event["id"])
+            )
+            return
+        start, end = _event_times(event)
+        if not start:
+            return
+        self._conn.execute(
+            """
+            INSERT INTO events (calendar_id, id, summary, start, end, start_ts, end_ts, raw)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(calendar_id, id) DO UPDATE SET
+                summary = excluded.summary, start = excluded.start, end = excluded.end,
+                start_ts = excluded.start_ts, end_ts = excluded.end_ts, raw = excluded.raw
+            """,
+            (
+                calendar_id, event["id"], event.get("summary", "(No Title)"), start, end,
+                to_timestamp(start), to_timestamp(end or start), json.dumps(event),
+            ),
+        )
+
+    def _reset(self, calendar_id: str) -> None:
+        self._conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+        self._conn.execute("DELETE FROM sync_state WHERE calendar_id = ?", (calendar_id,))
+        self._conn.commit()
+
+    def _calendar_lock(self, calendar_id: str):
+        with self._lock:
+            return self._sync_locks.setdefault(calendar_id, threading.Lock())
+
+    def sync(self, service, calendar_id: str = "primary") -> int:
+        """
+        Bring one calendar up to date and return the number of changed events.
+
+        Without a stored sync token this is a full listing; afterwards only
+        changes since the previous sync are transferred. Different calendars
+        can sync concurrently: the database is only locked while applying.
+        """
+        with self._calendar_lock(calendar_id):
+            return self._sync(service, calendar_id)
+
+    def _sync(self, service, calendar_id: str) -> int:
+        """sync() body; the caller holds the calendar's sync lock."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sync_token FROM sync_state WHERE calendar_id = ?", (calendar_id,)
+            ).fetchone()
+        sync_token = row[0] if row else None
+        items = []
+        page_token = None
+        try:
+            while True:
+                kwargs = {"calendarId": calendar_id, "singleEvents": True, "maxResults": 2500}
+                if sync_token:
+                    kwargs["syncToken"] = sync_token
+                if page_token:
+                    kwargs["pageToken"] = page_token
+                resp = service.events().list(**kwargs).execute()
+                items.extend(resp.get("items", []))
+                page_token = resp.get("nextPageToken")
+                if not page_token:
+                    break
+        except HttpError as e:
+            if e.resp.status != 410 or not sync_token:
+                raise
+            # Sync token expired: Google requires a full resync
+            with self._lock:
+                self._reset(calendar_id)
+            return self._sync(service, calendar_id)
+
+        with self._lock:
+            for event in items:
+                self._upsert(calendar_id, event)
+            self._conn.execute(
+                "INSERT INTO sync_state (calendar_id, sync_token) VALUES (?, ?) "
+                "ON CONFLICT(calendar_id) DO UPDATE SET sync_token = excluded.sync_token",
+                (calendar_id, resp.get("nextSyncToken")),
+            )
+            self._conn.commit()
+            self._last_sync[calendar_id] = time.time()
+        return len(items)
+
+    def is_fresh(self, calendar_id: str = "primary") -> bool:
+        return time.time() - self._last_sync.get(calendar_id, 0.0) < SYNC_INTERVAL
+
+    def mark_stale(self, calendar_id: str = "primary") -> None:
+        """Force the next ensure_fresh to sync, e.g. after a local write."""
+        self._last_sync.pop(calendar_id, None)
+
+    def ensure_fresh(self, service, calendar_id: str = "primary") -> None:
+        if self.is_fresh(calendar_id):
+            return
+        with self._calendar_lock(calendar_id):
+            # Concurrent stale readers queue on the lock; only the first one syncs
+            if not self.is_fresh(calendar_id):
+                self._sync(service, calendar_id)
+
+    def events_between(self, start_ts: float, end_ts: float, calendar_id: str = "primary") -> list[dict]:
+        """Return events overlapping [start_ts, end_ts), ordered by start time."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, summary, start, end, start_ts FROM events "
+                "WHERE calendar_id = ? AND start_ts < ? AND end_ts > ? ORDER BY start_ts, id",
+                (calendar_id, end_ts, start_ts),
+            ).fetchall()
+        return [
+            {"id": r[0], "summary": r[1], "start": r[2], "end": r[3], "start_ts": r[4], "calendar_id": calendar_id}
+            for r in rows
+        ]
+
+
+class BusyIntervals:
+    """
+    Sorted, merged busy intervals (UTC timestamps) for fast overlap and gap queries.
+
+    Intervals are merged on construction so they are disjoint and ordered by
+    both start and end; each probe is then a binary search over the ends.
+    """
+
+    def __init__(self, intervals=()):
+        merged = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [s for s, _ in merged]
+        self.ends = [e for _, e in merged]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start: float, end: float) -> list[tuple[float, float]]:
+        """Return the busy intervals that intersect [start, end)."""
+        i = bisect.bisect_right(self.ends, start)
+        found = []
+        while i < len(self.starts) and self.starts[i] < end:
+            found.append((self.starts[i], self.ends[i]))
+            i += 1
+        return found
+
+    def is_free(self, start: float, end: float) -> bool:
+        i = bisect.bisect_right(self.ends, start)
+        return i == len(self.starts) or self.starts[i] >= end
+
+    def next_free(self, start: float, duration: float, limit: float):
+        """Return the earliest t >= start with [t, t + duration) free and t + duration <= limit, or None."""
+        i = bisect.bisect_right(self.ends, start)
+        t = start
+        while i < len(self.starts) and self.starts[i] < t + duration:
+            t = max(t, self.ends[i])
+            i += 1
+        return t if t + duration <= limit else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> CalendarStore:
+    """Return the process-wide calendar store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CalendarStore()
+        return _store
@@ -1,16 +1,36 @@
 import os
 import base64
+import contextlib
+import contextvars
 import datetime
+import heapq
+import sys
+import threading
+import time
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from email.mime.text import MIMEText
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest, build_http
 
-# Load environment (for ZOOM_ROOM_URL)
+import calendar_store
+import mail_store
+import metrics
+import quota
+
+# Load environment (for ZOOM_ROOM_URL and CALENDAR_IDS)
 load_dotenv()
 ZOOM_URL = os.getenv("ZOOM_ROOM_URL")
+# Calendars read by calendar_get_events: comma-separated ids, or "all" for
+# every calendar selected in the user's calendar list
+CALENDAR_IDS = os.getenv("CALENDAR_IDS", "primary")
+# Upper bound on calendars fetched at the same time
+CALENDAR_FETCH_WORKERS = 8
 
 # Unified credentials
 SCOPES = [
@@ -24,65 +44,520 @@ SCOPES = [
 _SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CREDENTIALS_PATH = os.path.join(_SCRIPT_DIR, "memory", "google_credentials.json")
 TOKEN_PATH = os.path.join(_SCRIPT_DIR, "memory", "token.json")
+# Guards token.json against concurrent writers in other processes
+TOKEN_LOCK_PATH = TOKEN_PATH + ".lock"
+# Refresh access tokens this long before they expire, so requests in flight
+# never race the expiry and the transport never has to refresh on its own
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# Built services and the shared credentials are kept for the life of the process,
+# keyed by (api_name, version), and dropped whenever token.json changes on disk.
+_service_lock = threading.Lock()
+_services = {}
+_creds = None
+_token_stamp = None
+# Held while refreshing, so concurrent callers share one refresh
+_refresh_lock = threading.Lock()
+_service_stats = {"hits": 0, "builds": 0, "refreshes": 0, "invalidations": 0}
+# httplib2 connections are not thread-safe, so every thread gets its own
+# authorized transport while sharing the cached services and credentials.
+_thread_local = threading.local()
+
+
+def _thread_http(creds):
+    http = getattr(_thread_local, 'http', None)
+    if http is None or http.credentials is not creds:
+        http = AuthorizedHttp(creds, http=build_http())
+        _thread_local.http = http
+    return http
+
+
+class _TimedHttpRequest(HttpRequest):
+    """
+    HttpRequest that goes through the quota scheduler and records latency and
+    response size per API method.
+    """
+
+    def execute(self, http=None, num_retries=0):
+        return quota.execute(self.methodId or "", lambda: self._timed_execute(http, num_retries))
+
+    def _timed_execute(self, http, num_retries):
+        if not metrics.ENABLED:
+            return super().execute(http=http, num_retries=num_retries)
+        postproc = self.postproc
+        with metrics.timed("http", self.methodId or self.method) as info:
+            def measured(resp, content):
+                info["bytes"] = len(content or b"")
+                return postproc(resp, content)
+            self.postproc = measured
+            try:
+                return super().execute(http=http, num_retries=num_retries)
+            finally:
+                self.postproc = postproc
+
+
+def _build_request(http, *args, **kwargs):
+    # Use the credentials the service was built with: the global may have been
+    # dropped by another thread (token.json changed) since the service was handed out
+    creds = getattr(http, 'credentials', None)
+    if creds is None:
+        with _service_lock:
+            creds = _creds
+    _ensure_fresh_credentials(creds)
+    return _TimedHttpRequest(_thread_http(creds), *args, **kwargs)
+
+
+def _token_file_stamp():
+    try:
+        st = os.stat(TOKEN_PATH)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+@contextlib.contextmanager
+def _token_file_lock():
+    """Exclusive inter-process lock on token.json (advisory, via a sidecar file)."""
+    os.makedirs(os.path.dirname(TOKEN_LOCK_PATH), exist_ok=True)
+    with open(TOKEN_LOCK_PATH, "a+") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _save_credentials(creds):
+    """Write token.json atomically; call with the token file lock held."""
+    tmp = f"{TOKEN_PATH}.{os.getpid()}.tmp"
+    with open(tmp, "w") as token:
+        token.write(creds.to_json())
+        token.flush()
+        os.fsync(token.fileno())
+    os.replace(tmp, TOKEN_PATH)
+
+
+def _read_token_file():
+    if not os.path.exists(TOKEN_PATH):
+        return None
+    with metrics.timed("google", "load_token"):
+        return Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
+
+
+def _needs_refresh(creds):
+    """True if creds are invalid or expire within TOKEN_REFRESH_MARGIN."""
+    if not creds.valid:
+        return True
+    if creds.expiry is None:
+        return False
+    # google-auth keeps expiry as a naive UTC datetime
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return creds.expiry - TOKEN_REFRESH_MARGIN <= now
+
+
+def _refresh_credentials(creds):
+    """
+    Refresh creds in place, at most once across threads and processes.
+
+    Threads that arrive while a refresh is in flight wait for it and then find
+    nothing left to do. Under the file lock, a token that another process has
+    already refreshed and saved is adopted instead of refreshing again.
+    """
+    with _refresh_lock:
+        if not _needs_refresh(creds):
+            return
+        with _token_file_lock():
+            stored = _read_token_file()
+            if (stored is not None and stored.refresh_token == creds.refresh_token
+                    and not _needs_refresh(stored)):
+                creds.token = stored.token
+                creds.expiry = stored.expiry
+                return
+            with metrics.timed("google", "refresh_token"):
+                creds.refresh(Request())
+            _service_stats["refreshes"] += 1
+            _save_credentials(creds)
+
+
+def _ensure_fresh_credentials(creds):
+    """Refresh creds ahead of expiry and record the token.json we wrote as current."""
+    global _token_stamp
+    if creds is None or not creds.refresh_token or not _needs_refresh(creds):
+        return
+    _refresh_credentials(creds)
+    with _service_lock:
+        if _creds is creds:
+            _token_stamp = _token_file_stamp()
+
+
+def _load_credentials():
+    creds = _read_token_file()
+    if creds and creds.refresh_token:
+        _refresh_credentials(creds)
+    elif not creds or not creds.valid:
+        flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
+        creds = flow.run_local_server(port=8080)
+        with _token_file_lock():
+            _save_credentials(creds)
+    return creds
+
+
+def invalidate_service_cache():
+    """Drop cached services and credentials so the next call reloads token.json."""
+    global _creds, _token_stamp
+    with _service_lock:
+        _services.clear()
+        _creds = None
+        _token_stamp = None
+        _service_stats["invalidations"] += 1
+
+
+def service_cache_stats():
+    """Return hit/build/refresh counters for the service registry."""
+    with _service_lock:
+        return dict(_service_stats, cached=sorted(f"{a}/{v}" for a, v in _services))
+
 
 def get_google_service(api_name, version):
-    creds = None
-    if os.path.exists(TOKEN_PATH):
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+    global _creds, _token_stamp
+    with _service_lock:
+        stamp = _token_file_stamp()
+        if _creds is not None and stamp != _token_stamp:
+            # token.json was rewritten (e.g. by init_oauth.py): start over
+            _services.clear()
+            _creds = None
+            _service_stats["invalidations"] += 1
+        if _creds is not None and not _creds.refresh_token and not _creds.valid:
+            # Nothing to refresh with: go back to token.json or the consent flow
+            _services.clear()
+            _creds = None
+        if _creds is None:
+            _creds = _load_credentials()
+            _token_stamp = _token_file_stamp()
+
+        key = (api_name, version)
+        service = _services.get(key)
+        if service is not None:
+            _service_stats["hits"] += 1
         else:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
-            creds = flow.run_local_server(port=8080)
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
-    return build(api_name, version, credentials=creds)
+            with metrics.timed("google", f"build:{api_name}/{version}"):
+                service = build(api_name, version, credentials=_creds, requestBuilder=_build_request)
+            _services[key] = service
+            _service_stats["builds"] += 1
+        creds = _creds
+    # Outside the registry lock, so cache hits never wait on a token refresh
+    _ensure_fresh_credentials(creds)
+    return service
 
 # ───── Gmail Functions ─────
 
-def list_emails(query='is:unread', max_results=5):
+# Gmail accepts up to 100 calls per batch request but starts rate limiting
+# well before that, so keep chunks moderate.
+GMAIL_BATCH_SIZE = 50
+# Default page size for paginated listings (Gmail allows up to 500)
+GMAIL_PAGE_SIZE = 50
+
+# messages.batchModify accepts at most 1,000 ids per call
+GMAIL_MODIFY_CHUNK = 1000
+
+# Headers requested in metadata-only listings (format='metadata')
+METADATA_HEADERS = ['From', 'To', 'Subject', 'Date']
+
+
+def extract_plain_text(payload):
+    """Return the first text/plain part of a message payload, decoded."""
+    if payload.get("mimeType") == "text/plain":
+        data = payload.get("body", {}).get("data", "")
+        return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
+    elif payload.get("mimeType", "").startswith("multipart/"):
+        for part in payload.get("parts", []):
+            result = extract_plain_text(part)
+            if result:
+                return result
+    return ""
+
+
+def _header(headers, name, default):
+    return next((h['value'] for h in headers if h['name'] == name), default)
+
+
+def batch_get_messages(service, msg_ids, batch_size=GMAIL_BATCH_SIZE, **get_kwargs):
+    """
+    Fetch many messages through the Gmail batch endpoint.
+
+    Returns a dict mapping message id to its resource. Items rejected for rate
+    limiting are retried in a smaller batch after a backoff; other failures
+    are left out and reported, so one bad id never sinks the batch.
+    """
+    results = {}
+    # Building a resource object re-parses its discovery methods, so do it once
+    messages = service.users().messages()
+    unit_cost = quota.cost('gmail.users.messages.get')
+
+    for i in range(0, len(msg_ids), max(1, batch_size)):
+        pending = msg_ids[i:i + batch_size]
+        for attempt in range(quota.MAX_RETRIES + 1):
+            retry = []
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    results[request_id] = response
+                elif attempt < quota.MAX_RETRIES and quota.is_retryable(exception, 'gmail.users.messages.get'):
+                    retry.append((request_id, exception))
+                else:
+                    print(f"Error fetching email {request_id}: {exception}", file=sys.stderr)
+
+            def send():
+                batch = service.new_batch_http_request(callback=callback)
+                for msg_id in pending:
+                    batch.add(messages.get(userId='me', id=msg_id, **get_kwargs), request_id=msg_id)
+                with metrics.timed("http", "gmail.batch"):
+                    batch.execute()
+
+            quota.execute('gmail.batch', send, units=unit_cost * len(pending))
+            if not retry:
+                break
+            pending = [request_id for request_id, _ in retry]
+            time.sleep(max(quota.retry_delay(e, attempt) for _, e in retry))
+    return results
+
+
+def _message_record(msg_data, with_body):
+    """Flatten a messages.get resource into the record kept by mail_store."""
+    payload = msg_data.get('payload', {})
+    headers = payload.get('headers', [])
+    record = {
+        'id': msg_data['id'],
+        'thread_id': msg_data.get('threadId'),
+        'subject': _header(headers, 'Subject', '(No Subject)'),
+        'from': _header(headers, 'From', '(Unknown Sender)'),
+        'to': _header(headers, 'To', '(Unknown Recipient)'),
+        'date': _header(headers, 'Date', '(Unknown Date)'),
+        'snippet': msg_data.get('snippet', ''),
+        'labels': msg_data.get('labelIds', []),
+        'body': None,
+    }
+    if with_body:
+        record['body'] = extract_plain_text(payload).strip() or '[No body found]'
+    return record
+
+
+def fetch_records(service, msg_ids, include_body=False, batch_size=GMAIL_BATCH_SIZE):
+    """
+    Return {id: record} for msg_ids, reading from the local mail store first
+    and batch-fetching only what it is missing.
+    """
+    store = mail_store.get_store()
+    store.ensure_fresh(service)
+    records = store.get_many(msg_ids, need_body=include_body)
+    missing = [msg_id for msg_id in msg_ids if msg_id not in records]
+    if missing:
+        if include_body:
+            get_kwargs = {'format': 'full'}
+        else:
+            get_kwargs = {'format': 'metadata', 'metadataHeaders': METADATA_HEADERS}
+        fetched = batch_get_messages(service, missing, batch_size=batch_size, **get_kwargs)
+        new_records = [_message_record(msg_data, include_body) for msg_data in fetched.values()]
+        store.put_many(new_records)
+        records.update((r['id'], r) for r in new_records)
+    return records
+
+
+def list_emails(query='is:unread', max_results=5, batch_size=GMAIL_BATCH_SIZE, include_body=True):
+    """
+    List messages matching a Gmail query.
+
+    With include_body=False only the headers in METADATA_HEADERS and the
+    snippet are requested, so no body is downloaded or decoded; use
+    get_email_by_id to fetch a body on demand. Messages already in the local
+    mail store are not fetched again.
+    """
     service = get_google_service('gmail', 'v1')
     results = service.users().messages().list(userId='me', q=query, maxResults=max_results).execute()
-    messages = results.get('messages', [])
-    emails = []
+    msg_ids = [msg['id'] for msg in results.get('messages', [])]
+    records = fetch_records(service, msg_ids, include_body=include_body, batch_size=batch_size)
+    return _format_emails(msg_ids, records, include_body)
 
-    def extract_plain_text(payload):
-        if payload.get("mimeType") == "text/plain":
-            data = payload.get("body", {}).get("data", "")
-            return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
-        elif payload.get("mimeType", "").startswith("multipart/"):
-            for part in payload.get("parts", []):
-                result = extract_plain_text(part)
-                if result:
-                    return result
-        return ""
-
-    for msg in messages:
-        msg_data = service.users().messages().get(userId='me', id=msg['id'], format='full').execute()
-        payload = msg_data.get('payload', {})
-        headers = payload.get('headers', [])
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '(No Subject)')
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), '(Unknown Sender)')
-        body = extract_plain_text(payload)
-
-        emails.append({
-            'id': msg['id'],
-            'subject': subject,
-            'from': sender,
-            'body': body.strip() or '[No body found]',
-            'snippet': msg_data.get('snippet', '')
-        })
 
+def _format_emails(msg_ids, records, include_body):
+    emails = []
+    for msg_id in msg_ids:
+        record = records.get(msg_id)
+        if record is None:
+            continue
+        email = {
+            'id': msg_id,
+            'subject': record['subject'],
+            'from': record['from'],
+            'snippet': record['snippet']
+        }
+        if include_body:
+            email['body'] = record['body']
+        else:
+            email['to'] = record['to']
+            email['date'] = record['date']
+        emails.append(email)
     return emails
 
+
+def iter_email_pages(query='is:unread', page_size=GMAIL_PAGE_SIZE, include_body=False,
+                     page_token=None, batch_size=GMAIL_BATCH_SIZE, prefetch=True):
+    """
+    Walk every message matching a query, one page at a time.
+
+    Yields (emails, next_page_token) tuples; next_page_token is None on the
+    last page and can be passed back as page_token to resume later. With
+    prefetch, the next page of ids is listed in the background while the
+    current page is being hydrated. Only one page is held in memory at a time.
+    """
+    service = get_google_service('gmail', 'v1')
+
+    def list_page(token):
+        kwargs = {'userId': 'me', 'q': query, 'maxResults': page_size}
+        if token:
+            kwargs['pageToken'] = token
+        return service.users().messages().list(**kwargs).execute()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        results = list_page(page_token)
+        while True:
+            next_token = results.get('nextPageToken')
+            upcoming = None
+            if next_token and prefetch:
+                upcoming = pool.submit(contextvars.copy_context().run, list_page, next_token)
+            msg_ids = [msg['id'] for msg in results.get('messages', [])]
+            records = fetch_records(service, msg_ids, include_body=include_body, batch_size=batch_size)
+            yield _format_emails(msg_ids, records, include_body), next_token
+            if not next_token:
+                return
+            results = upcoming.result() if upcoming else list_page(next_token)
+
+
+def get_email_page(query='is:unread', page_size=GMAIL_PAGE_SIZE, page_token=None, include_body=False):
+    """Return (emails, next_page_token) for a single page, without prefetching the next one."""
+    pages = iter_email_pages(query, page_size=page_size, include_body=include_body,
+                             page_token=page_token, prefetch=False)
+    try:
+        return next(pages, ([], None))
+    finally:
+        pages.close()
+
+
+def iter_emails(query='is:unread', page_size=GMAIL_PAGE_SIZE, include_body=False):
+    """Yield every message matching a query, fetching pages lazily."""
+    for emails, _ in iter_email_pages(query, page_size=page_size, include_body=include_body):
+        yield from emails
+
+def search_cached_emails(query, max_results=10):
+    """
+    Search the local mail store only. The Gmail API is called at most once,
+    to learn label names the first time a query uses label:.
+    """
+    store = mail_store.get_store()
+    if 'label:' in query.lower() and not store.has_label_names():
+        _list_labels(get_google_service('gmail', 'v1'))
+    return store.search(query, limit=max_results)
+
 def mark_as_read(msg_id):
     service = get_google_service('gmail', 'v1')
     service.users().messages().modify(userId='me', id=msg_id, body={'removeLabelIds': ['UNREAD']}).execute()
+    mail_store.get_store().update_labels([msg_id], remove=['UNREAD'])
 
 def star_email(msg_id):
     service = get_google_service('gmail', 'v1')
     service.users().messages().modify(userId='me', id=msg_id, body={'addLabelIds': ['STARRED']}).execute()
+    mail_store.get_store().update_labels([msg_id], add=['STARRED'])
+
+def list_message_ids(service, query, limit=None):
+    """Return the ids of all messages matching query (up to limit), without hydrating them."""
+    msg_ids = []
+    page_token = None
+    while True:
+        page_size = 500 if limit is None else min(500, limit - len(msg_ids))
+        kwargs = {'userId': 'me', 'q': query, 'maxResults': page_size}
+        if page_token:
+            kwargs['pageToken'] = page_token
+        results = service.users().messages().list(**kwargs).execute()
+        msg_ids.extend(msg['id'] for msg in results.get('messages', []))
+        page_token = results.get('nextPageToken')
+        if not page_token or (limit is not None and len(msg_ids) >= limit):
+            return msg_ids
+
+
+def _list_labels(service):
+    """Fetch the mailbox's labels and let the mail store resolve label: names with them."""
+    labels = service.users().labels().list(userId='me').execute().get('labels', [])
+    mail_store.get_store().set_label_names(labels)
+    return labels
+
+
+def _resolve_label_ids(service, *label_lists):
+    """Map label names (case-insensitive) to Gmail label ids; ids pass through unchanged."""
+    known = _list_labels(service)
+    by_name = {label['name'].lower(): label['id'] for label in known}
+    ids = {label['id'] for label in known}
+    resolved = []
+    for labels in label_lists:
+        resolved.append([])
+        for label in labels or []:
+            if label in ids:
+                resolved[-1].append(label)
+            elif label.lower() in by_name:
+                resolved[-1].append(by_name[label.lower()])
+            else:
+                raise ValueError(f"Unknown label: {label}")
+    return resolved
+
+
+def bulk_modify_labels(msg_ids=None, query=None, add_labels=None, remove_labels=None,
+                       max_messages=GMAIL_MODIFY_CHUNK, chunk_size=GMAIL_MODIFY_CHUNK):
+    """
+    Add and remove labels on many messages with users.messages.batchModify.
+
+    Targets the given ids plus, if query is set, up to max_messages matching
+    messages. Common label sets: archive = remove INBOX, mark read = remove
+    UNREAD, unstar = remove STARRED. Returns one result dict per chunk.
+    """
+    if not add_labels and not remove_labels:
+        raise ValueError("Nothing to do: give add_labels and/or remove_labels")
+    service = get_google_service('gmail', 'v1')
+    targets = list(msg_ids or [])
+    if query:
+        targets.extend(list_message_ids(service, query, limit=max_messages))
+    targets = list(dict.fromkeys(targets))
+    if not targets:
+        return []
+
+    add_ids, remove_ids = _resolve_label_ids(service, add_labels, remove_labels)
+    body = {}
+    if add_ids:
+        body['addLabelIds'] = add_ids
+    if remove_ids:
+        body['removeLabelIds'] = remove_ids
+
+    store = mail_store.get_store()
+    results = []
+    chunk_size = max(1, min(chunk_size, GMAIL_MODIFY_CHUNK))
+    for i in range(0, len(targets), chunk_size):
+        chunk = targets[i:i + chunk_size]
+        try:
+            service.users().messages().batchModify(userId='me', body=dict(body, ids=chunk)).execute()
+            store.update_labels(chunk, add=add_ids, remove=remove_ids)
+            results.append({'chunk': i // chunk_size + 1, 'count': len(chunk), 'ok': True, 'error': None})
+        except Exception as e:
+            results.append({'chunk': i // chunk_size + 1, 'count': len(chunk), 'ok': False, 'error': str(e)})
+    return results
 
 def send_email(to, subject, body_text, cc=None, bcc=None):
     service = get_google_service('gmail', 'v1')
@@ -102,34 +577,21 @@ def send_email(to, subject, body_text, cc=None, bcc=None):
 def get_email_by_id(email_id):
     service = get_google_service('gmail', 'v1')
     try:
-        msg_data = service.users().messages().get(userId='me', id=email_id, format='full').execute()
-        payload = msg_data.get('payload', {})
-        headers = payload.get('headers', [])
-
-        def extract_plain_text(payload):
-            if payload.get("mimeType") == "text/plain":
-                data = payload.get("body", {}).get("data", "")
-                return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
-            elif payload.get("mimeType", "").startswith("multipart/"):
-                for part in payload.get("parts", []):
-                    result = extract_plain_text(part)
-                    if result:
-                        return result
-            return ""
-
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '(No Subject)')
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), '(Unknown Sender)')
-        to = next((h['value'] for h in headers if h['name'] == 'To'), '(Unknown Recipient)')
-        date = next((h['value'] for h in headers if h['name'] == 'Date'), '(Unknown Date)')
-        body = extract_plain_text(payload).strip() or '[No body found]'
+        store = mail_store.get_store()
+        store.ensure_fresh(service)
+        record = store.get(email_id, need_body=True)
+        if record is None:
+            msg_data = service.users().messages().get(userId='me', id=email_id, format='full').execute()
+            record = _message_record(msg_data, True)
+            store.put_many([record])
 
         return {
             'id': email_id,
-            'subject': subject,
-            'from': sender,
-            'to': to,
-            'date': date,
-            'body': body
+            'subject': record['subject'],
+            'from': record['from'],
+            'to': record['to'],
+            'date': record['date'],
+            'body': record['body']
         }
     except Exception as e:
         print(f"Error fetching email {email_id}: {e}")
@@ -137,30 +599,154 @@ def get_email_by_id(email_id):
 
 # ───── Calendar Functions ─────
 
-def get_events_between_dates(start_date: str, end_date: str):
+def list_calendar_ids(service=None, selected_only=True):
+    """Return the ids of the calendars in the user's calendar list, primary first."""
+    service = service or get_google_service('calendar', 'v3')
+    calendar_ids = ['primary']
+    page_token = None
+    while True:
+        kwargs = {'pageToken': page_token} if page_token else {}
+        result = service.calendarList().list(**kwargs).execute()
+        for item in result.get('items', []):
+            if item.get('primary') or (selected_only and not item.get('selected')):
+                continue
+            calendar_ids.append(item['id'])
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return calendar_ids
+
+
+def _resolve_calendar_ids(service, calendar_ids):
+    if calendar_ids is None:
+        calendar_ids = CALENDAR_IDS
+    if isinstance(calendar_ids, str):
+        if calendar_ids.strip().lower() == 'all':
+            return list_calendar_ids(service)
+        calendar_ids = [c.strip() for c in calendar_ids.split(',') if c.strip()]
+    return list(dict.fromkeys(calendar_ids)) or ['primary']
+
+
+def get_events_between_dates(start_date: str, end_date: str, calendar_ids=None):
+    """
+    Return events between two dates across one or more calendars.
+
+    Events are served from the locally synced event store. Stale calendars are
+    synced concurrently, and the per-calendar results (each already ordered)
+    are k-way merged into one time-ordered list.
+    """
     service = get_google_service('calendar', 'v3')
+    store = calendar_store.get_store()
+    calendar_ids = _resolve_calendar_ids(service, calendar_ids)
+
+    start_ts = calendar_store.to_timestamp(f"{start_date}T00:00:00Z")
+    end_ts = calendar_store.to_timestamp(f"{end_date}T23:59:59Z")
+
+    def fetch(calendar_id):
+        store.ensure_fresh(service, calendar_id)
+        return store.events_between(start_ts, end_ts, calendar_id)
 
-    start_dt = f"{start_date}T00:00:00Z"
-    end_dt = f"{end_date}T23:59:59Z"
+    if len(calendar_ids) == 1:
+        per_calendar = [fetch(calendar_ids[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(CALENDAR_FETCH_WORKERS, len(calendar_ids))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, fetch, cal_id) for cal_id in calendar_ids]
+            per_calendar = [future.result() for future in futures]
+    return list(heapq.merge(*per_calendar, key=lambda event: event['start_ts']))
 
-    events_result = service.events().list(
-        calendarId='primary',
-        timeMin=start_dt,
-        timeMax=end_dt,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
+LOCAL_TZ = ZoneInfo('Europe/Paris')
 
-    events = events_result.get('items', [])
 
-    formatted = []
-    for event in events:
-        summary = event.get('summary', '(No Title)')
-        start = event.get('start', {}).get('dateTime', event.get('start', {}).get('date', ''))
-        end = event.get('end', {}).get('dateTime', event.get('end', {}).get('date', ''))
-        formatted.append({"id": event['id'], "summary": summary, "start": start, "end": end})
+def _local_timestamp(value: str) -> float:
+    """Parse an ISO date/time; naive values are taken to be in Europe/Paris."""
+    dt = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=LOCAL_TZ)
+    return dt.timestamp()
+
+
+def _format_local(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, LOCAL_TZ).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def get_busy_intervals(start_time, end_time, attendees_emails=None):
+    """
+    Query free/busy for the user's primary calendar and any attendees in one call.
+
+    Returns ({calendar_id: BusyIntervals}, {calendar_id: error reason}); calendars
+    whose availability cannot be read appear only in the second dict.
+    """
+    service = get_google_service('calendar', 'v3')
+    calendar_ids = ['primary'] + [e.strip() for e in attendees_emails or [] if e.strip()]
+    body = {
+        'timeMin': datetime.datetime.fromtimestamp(_local_timestamp(start_time), datetime.timezone.utc).isoformat(),
+        'timeMax': datetime.datetime.fromtimestamp(_local_timestamp(end_time), datetime.timezone.utc).isoformat(),
+        'items': [{'id': cal_id} for cal_id in calendar_ids],
+    }
+    result = service.freebusy().query(body=body).execute()
+
+    busy = {}
+    errors = {}
+    for cal_id, info in result.get('calendars', {}).items():
+        if info.get('errors'):
+            errors[cal_id] = ", ".join(err.get('reason', 'unknown') for err in info['errors'])
+            continue
+        busy[cal_id] = calendar_store.BusyIntervals(
+            (calendar_store.to_timestamp(b['start']), calendar_store.to_timestamp(b['end']))
+            for b in info.get('busy', [])
+        )
+    return busy, errors
+
+
+def find_conflicts(start_time, end_time, attendees_emails=None):
+    """Return ({calendar_id: [(start, end), ...]}, errors) for busy time overlapping the proposed slot."""
+    busy, errors = get_busy_intervals(start_time, end_time, attendees_emails)
+    start_ts, end_ts = _local_timestamp(start_time), _local_timestamp(end_time)
+    conflicts = {}
+    for cal_id, intervals in busy.items():
+        hits = intervals.overlapping(start_ts, end_ts)
+        if hits:
+            conflicts[cal_id] = [(_format_local(s), _format_local(e)) for s, e in hits]
+    return conflicts, errors
+
+
+def find_free_slots(start_time, end_time, duration_minutes=30, count=5, attendees_emails=None,
+                    day_start="09:00", day_end="18:00", include_weekends=False, step_minutes=15):
+    """
+    Propose up to count free slots of duration_minutes where everyone is available.
+
+    Slots are searched within working hours (day_start-day_end, Europe/Paris),
+    start on step_minutes boundaries and do not overlap each other.
+    Returns (slots, errors) with slots as (start, end) local ISO strings.
+    """
+    busy, errors = get_busy_intervals(start_time, end_time, attendees_emails)
+    combined = calendar_store.BusyIntervals(
+        (s, e) for intervals in busy.values() for s, e in zip(intervals.starts, intervals.ends)
+    )
+    duration = duration_minutes * 60
+    step = step_minutes * 60
+    range_start, range_end = _local_timestamp(start_time), _local_timestamp(end_time)
+
+    slots = []
+    day = datetime.datetime.fromtimestamp(range_start, LOCAL_TZ).date()
+    last_day = datetime.datetime.fromtimestamp(range_end, LOCAL_TZ).date()
+    while day <= last_day and len(slots) < count:
+        if include_weekends or day.weekday() < 5:
+            window_start = max(range_start, _local_timestamp(f"{day.isoformat()}T{day_start}"))
+            window_end = min(range_end, _local_timestamp(f"{day.isoformat()}T{day_end}"))
+            t = window_start
+            while len(slots) < count:
+                t = combined.next_free(t, duration, window_end)
+                if t is None:
+                    break
+                aligned = -(-t // step) * step
+                if aligned != t:
+                    t = aligned
+                    continue
+                slots.append((_format_local(t), _format_local(t + duration)))
+                t += duration
+        day += datetime.timedelta(days=1)
+    return slots, errors
 
-    return formatted
 
 def create_event(summary, start_time, end_time, description="", attendees_emails=None):
     service = get_google_service('calendar', 'v3')
@@ -176,6 +762,7 @@ def create_event(summary, start_time, end_time, description="", attendees_emails
     }
 
     event = service.events().insert(calendarId='primary', body=event, sendUpdates="all").execute()
+    calendar_store.get_store().mark_stale()
     return f"✅ Event created: [{event.get('summary')}]({event.get('htmlLink')})"
 
 
@@ -194,6 +781,7 @@ def update_event(event_id, summary=None, start_time=None, end_time=None, descrip
         event['description'] = description
 
     updated = service.events().update(calendarId='primary', eventId=event_id, body=event, sendUpdates="all").execute()
+    calendar_store.get_store().mark_stale()
     return f"✅ Event updated: {updated.get('summary')}"
 
 
@@ -201,4 +789,5 @@ def delete_event(event_id):
     """Delete a calendar event."""
     service = get_google_service('calendar', 'v3')
     service.events().delete(calendarId='primary', eventId=event_id, sendUpdates="all").execute()
+    calendar_store.get_store().mark_stale()
     return "✅ Event deleted"
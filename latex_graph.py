@@ -0,0 +1,218 @@
+"""
+Document structure of an Overleaf project: includes, labels, references and
+citations.
+
+Every .tex file in the project's git manifest is scanned line by line (with
+comments stripped) for \\input/\\include/\\subfile/\\import, \\label, the
+\\ref family, the \\cite family and bibliography declarations; every .bib file
+for its entry keys. Parsed files are cached and re-parsed only when their
+mtime or size changes, and the cross-file lookup tables are rebuilt only
+after a file changed, so queries cost little more than a stat per file.
+"""
+
+import posixpath
+import re
+import threading
+from pathlib import Path
+
+import overleaf_utils
+
+_COMMENT = re.compile(r"(?<!\\)%.*")
+_INCLUDE = re.compile(r"\\(input|include|subfile)\s*\{([^}]+)\}")
+_IMPORT = re.compile(r"\\(sub)?(?:import|inputfrom|includefrom)\*?\s*\{([^}]*)\}\s*\{([^}]+)\}")
+_LABEL = re.compile(r"\\label\s*\{([^}]+)\}")
+_REF = re.compile(r"\\(?:ref|eqref|pageref|autoref|nameref|vref|cref|Cref|cpageref|Cpageref|labelcref)\*?\s*\{([^}]+)\}")
+_CITE = re.compile(r"\\[a-zA-Z]*cite[a-zA-Z]*\*?(?:\s*\[[^\]]*\])*\s*\{([^}]+)\}")
+_BIBLIOGRAPHY = re.compile(r"\\(?:bibliography|addbibresource)\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}")
+_DOCUMENTCLASS = re.compile(r"\\documentclass\b")
+_BIB_ENTRY = re.compile(r"@(\w+)\s*[{(]\s*([^,\s{}()]+)\s*,")
+_BIB_SKIP = {"string", "comment", "preamble"}
+
+
+def _keys(arg: str) -> list[str]:
+    return [k.strip() for k in arg.split(",") if k.strip()]
+
+
+class _ParsedFile:
+    """Occurrences found in one file; each occurrence is (key or target, line)."""
+
+    __slots__ = ("stamp", "is_root", "includes", "labels", "refs", "cites", "bibs", "entries")
+
+    def __init__(self, stamp):
+        self.stamp = stamp
+        self.is_root = False
+        self.includes = []  # (kind, candidate paths, line)
+        self.labels = []
+        self.refs = []
+        self.cites = []
+        self.bibs = []
+        self.entries = []
+
+
+def _parse_tex(path: str, text: str, stamp) -> _ParsedFile:
+    parsed = _ParsedFile(stamp)
+    here = posixpath.dirname(path)
+    for number, line in enumerate(text.splitlines(), 1):
+        line = _COMMENT.sub("", line)
+        if "\\" not in line:
+            continue
+        if _DOCUMENTCLASS.search(line):
+            parsed.is_root = True
+        for kind, target in _INCLUDE.findall(line):
+            target = target.strip()
+            # LaTeX resolves against the main file's directory; subfiles against its own
+            bases = [here, ""] if kind == "subfile" else ["", here]
+            parsed.includes.append((kind, [posixpath.normpath(posixpath.join(b, target)) for b in bases], number))
+        for sub, directory, target in _IMPORT.findall(line):
+            base = posixpath.join(here, directory.strip()) if sub else directory.strip()
+            parsed.includes.append(("import", [posixpath.normpath(posixpath.join(base, target.strip()))], number))
+        parsed.labels += [(key.strip(), number) for key in _LABEL.findall(line)]
+        parsed.refs += [(key, number) for arg in _REF.findall(line) for key in _keys(arg)]
+        parsed.cites += [(key, number) for arg in _CITE.findall(line) for key in _keys(arg) if key != "*"]
+        parsed.bibs += [(name, number) for arg in _BIBLIOGRAPHY.findall(line) for name in _keys(arg)]
+    return parsed
+
+
+def _parse_bib(text: str, stamp) -> _ParsedFile:
+    parsed = _ParsedFile(stamp)
+    for number, line in enumerate(text.splitlines(), 1):
+        for kind, key in _BIB_ENTRY.findall(line):
+            if kind.lower() not in _BIB_SKIP:
+                parsed.entries.append((key, number))
+    return parsed
+
+
+def _with_suffix(candidate: str, files, suffix: str):
+    """Return the project file a LaTeX reference to candidate resolves to, or None."""
+    for name in (candidate, candidate + suffix):
+        if name in files:
+            return name
+    return None
+
+
+class DocumentGraph:
+    def __init__(self, project_path: Path):
+        self.project_path = project_path
+        self._files = {}
+        self._all_paths = set()
+        self._tables = None
+        self._lock = threading.Lock()
+
+    def refresh(self, manifest: dict) -> None:
+        """Re-parse files whose stamp changed and drop ones that disappeared."""
+        wanted = {}
+        for path in manifest:
+            if Path(path).suffix.lower() in (".tex", ".bib"):
+                wanted[path] = overleaf_utils.file_stamp(self.project_path / path)
+        with self._lock:
+            # Includes may name any file (.tikz, .pgf, ...), so track the full path set too
+            changed = self._all_paths != manifest.keys()
+            if changed:
+                self._all_paths = set(manifest)
+            for path in [p for p in self._files if wanted.get(p) is None]:
+                del self._files[path]
+                changed = True
+            for path, stamp in wanted.items():
+                cached = self._files.get(path)
+                if stamp is None or (cached is not None and cached.stamp == stamp):
+                    continue
+                try:
+                    text = (self.project_path / path).read_text(encoding="utf-8", errors="replace")
+                except OSError:
+                    continue
+                if path.lower().endswith(".bib"):
+                    self._files[path] = _parse_bib(text, stamp)
+                else:
+                    self._files[path] = _parse_tex(path, text, stamp)
+                changed = True
+            if changed or self._tables is None:
+                self._tables = self._build_tables()
+
+    def _build_tables(self) -> dict:
+        """Cross-file lookups: key -> [(path, line)] for each kind, plus the resolved include edges."""
+        labels, refs, cites, entries = {}, {}, {}, {}
+        children = {}
+        missing = []
+        for path, parsed in self._files.items():
+            for key, line in parsed.labels:
+                labels.setdefault(key, []).append((path, line))
+            for key, line in parsed.refs:
+                refs.setdefault(key, []).append((path, line))
+            for key, line in parsed.cites:
+                cites.setdefault(key, []).append((path, line))
+            for key, line in parsed.entries:
+                entries.setdefault(key, []).append((path, line))
+            for kind, candidates, line in parsed.includes:
+                target = next((t for t in (_with_suffix(c, self._all_paths, ".tex") for c in candidates) if t), None)
+                children.setdefault(path, []).append((target or candidates[0], line, target is not None))
+                if target is None:
+                    missing.append((f"\\{kind}{{{candidates[0]}}}", path, line))
+            for name, line in parsed.bibs:
+                if _with_suffix(name, self._all_paths, ".bib") is None:
+                    missing.append((f"bibliography {name}", path, line))
+        included = {child for edges in children.values() for child, _, ok in edges if ok}
+        roots = sorted(p for p, parsed in self._files.items() if parsed.is_root)
+        if not roots:
+            roots = sorted(p for p in self._files if p.endswith(".tex") and p not in included)
+        return {"labels": labels, "refs": refs, "cites": cites, "entries": entries,
+                "children": children, "roots": roots, "missing": missing}
+
+    def include_tree(self) -> str:
+        """Indented include tree from each root document."""
+        with self._lock:
+            tables = self._tables
+        lines = []
+
+        def walk(path, depth, seen):
+            for child, line, ok in tables["children"].get(path, []):
+                note = "" if ok else "  (missing)"
+                if child in seen:
+                    note = "  (cycle)"
+                lines.append(f"{'  ' * depth}{child}  [line {line}]{note}")
+                if ok and child not in seen:
+                    walk(child, depth + 1, seen | {child})
+
+        for root in tables["roots"]:
+            lines.append(root)
+            walk(root, 1, {root})
+        return "\n".join(lines)
+
+    def resolve(self, key: str) -> dict:
+        """Where key is defined (label or bib entry) and where it is referenced or cited."""
+        with self._lock:
+            tables = self._tables
+        return {
+            "labels": tables["labels"].get(key, []),
+            "refs": tables["refs"].get(key, []),
+            "entries": tables["entries"].get(key, []),
+            "cites": tables["cites"].get(key, []),
+        }
+
+    def unresolved(self) -> dict:
+        """Dangling refs and cites, duplicate definitions and missing included files."""
+        with self._lock:
+            tables = self._tables
+        return {
+            "refs": {k: v for k, v in sorted(tables["refs"].items()) if k not in tables["labels"]},
+            "cites": {k: v for k, v in sorted(tables["cites"].items()) if k not in tables["entries"]},
+            "duplicate_labels": {k: v for k, v in sorted(tables["labels"].items()) if len(v) > 1},
+            "duplicate_entries": {k: v for k, v in sorted(tables["entries"].items()) if len(v) > 1},
+            "missing_files": tables["missing"],
+        }
+
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+def get_graph(project_name: str) -> DocumentGraph:
+    """Return the project's document graph, brought up to date with its checkout."""
+    project_path = overleaf_utils.get_project_path(project_name)
+    if not (project_path / ".git").exists():
+        raise ValueError(f"Project '{project_name}' not cloned. Run pull first.")
+    with _graphs_lock:
+        graph = _graphs.get(project_path)
+        if graph is None:
+            graph = _graphs[project_path] = DocumentGraph(project_path)
+    graph.refresh(overleaf_utils.project_manifest(project_path))
+    return graph
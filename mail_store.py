@@ -0,0 +1,463 @@
+"""
+Local SQLite mailbox cache for the Gmail tools.
+
+Messages are stored by id once they have been fetched. Gmail message content
+never changes after delivery, so only labels and deletions need to be kept in
+sync; that is done incrementally through users().history().list, starting from
+the last historyId we have seen.
+
+Subjects, senders and bodies are also kept in an FTS5 index, maintained by
+triggers, so cached mail can be searched without touching the network.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from googleapiclient.errors import HttpError
+
+_SCRIPT_DIR = Path(__file__).parent.absolute()
+STORE_PATH = _SCRIPT_DIR / "memory" / "mail_cache.sqlite3"
+
+# Seconds after a history sync during which the store is trusted as-is
+SYNC_INTERVAL = 60
+# Upper bound on cached body text; least recently read bodies are dropped first
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Upper bound on cached messages (headers included)
+MAX_MESSAGES = 20000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    subject TEXT,
+    sender TEXT,
+    recipient TEXT,
+    date TEXT,
+    snippet TEXT,
+    labels TEXT,
+    body TEXT,
+    body_bytes INTEGER NOT NULL DEFAULT 0,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_last_access ON messages(last_access);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# External-content FTS5 index over the messages table. The update trigger only
+# fires for indexed columns, so bumping last_access does not reindex a row.
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE messages_fts USING fts5(
+    subject, sender, body,
+    content='messages', content_rowid='rowid'
+);
+CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, subject, sender, body)
+    VALUES (new.rowid, new.subject, new.sender, new.body);
+END;
+CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, subject, sender, body)
+    VALUES ('delete', old.rowid, old.subject, old.sender, old.body);
+END;
+CREATE TRIGGER messages_fts_au AFTER UPDATE OF subject, sender, body ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, subject, sender, body)
+    VALUES ('delete', old.rowid, old.subject, old.sender, old.body);
+    INSERT INTO messages_fts(rowid, subject, sender, body)
+    VALUES (new.rowid, new.subject, new.sender, new.body);
+END;
+INSERT INTO messages_fts(messages_fts) VALUES ('rebuild');
+"""
+
+# Search filters mapped onto FTS columns, mirroring Gmail's operators
+_FTS_COLUMNS = {"from": "sender", "subject": "subject", "body": "body"}
+# Column weights for bm25(): subject matches rank above sender, then body
+_FTS_WEIGHTS = (5.0, 3.0, 1.0)
+# Gmail operators the cache cannot evaluate; rejected rather than matched as text
+_UNSUPPORTED_OPERATORS = {
+    "to", "cc", "bcc", "after", "before", "older", "newer", "older_than", "newer_than",
+    "has", "in", "filename", "size", "larger", "smaller", "category", "deliveredto",
+    "list", "rfc822msgid", "around",
+}
+# Query tokens: optionally prefixed "quoted phrases" (subject:"a b"), else whitespace-separated words
+_TOKEN = re.compile(r'[^\s"]*"[^"]*"\*?|\S+')
+
+_FIELDS = ("id", "thread_id", "subject", "sender", "recipient", "date", "snippet", "labels", "body")
+
+
+class MailStore:
+    """On-disk message store keyed by Gmail message id."""
+
+    def __init__(self, path=STORE_PATH, max_body_bytes=MAX_BODY_BYTES, max_messages=MAX_MESSAGES):
+        self.path = Path(path)
+        self.max_body_bytes = max_body_bytes
+        self.max_messages = max_messages
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()  # one history sync at a time
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        has_fts = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone()
+        if not has_fts:
+            self._conn.executescript(_FTS_SCHEMA)
+        self._last_sync = 0.0
+
+    # ───── Records ─────
+
+    @staticmethod
+    def _to_record(row) -> dict:
+        record = dict(zip(_FIELDS, row))
+        record["from"] = record.pop("sender")
+        record["to"] = record.pop("recipient")
+        record["labels"] = json.loads(record["labels"] or "[]")
+        return record
+
+    def get(self, msg_id: str, need_body: bool = False):
+        """Return the cached record for msg_id, or None if absent (or bodiless when need_body)."""
+        return self.get_many([msg_id], need_body=need_body).get(msg_id)
+
+    def get_many(self, msg_ids, need_body: bool = False) -> dict:
+        """Return {id: record} for the cached subset of msg_ids and mark them as used."""
+        if not msg_ids:
+            return {}
+        found = {}
+        with self._lock:
+            for i in range(0, len(msg_ids), 500):
+                chunk = list(msg_ids[i:i + 500])
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(_FIELDS)} FROM messages WHERE id IN ({marks})",
+                    chunk,
+                ).fetchall()
+                for row in rows:
+                    record = self._to_record(row)
+                    if need_body and record["body"] is None:
+                        continue
+                    found[record["id"]] = record
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE messages SET last_access = ? WHERE id = ?",
+                    [(now, msg_id) for msg_id in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, records) -> None:
+        """
+        Insert or update message records.
+
+        A record without a body never overwrites a body already in the store,
+        so metadata listings do not evict what get_email_by_id fetched.
+        """
+        if not records:
+            return
+        now = time.time()
+        rows = []
+        for r in records:
+            body = r.get("body")
+            rows.append((
+                r["id"], r.get("thread_id"), r.get("subject"), r.get("from"), r.get("to"),
+                r.get("date"), r.get("snippet"), json.dumps(r.get("labels", [])),
+                body, len(body.encode("utf-8")) if body is not None else 0, now,
+            ))
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT INTO messages (id, thread_id, subject, sender, recipient, date, snippet,
+                                      labels, body, body_bytes, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    thread_id = excluded.thread_id,
+                    subject = excluded.subject,
+                    sender = excluded.sender,
+                    recipient = COALESCE(excluded.recipient, messages.recipient),
+                    date = COALESCE(excluded.date, messages.date),
+                    snippet = excluded.snippet,
+                    labels = excluded.labels,
+                    body = COALESCE(excluded.body, messages.body),
+                    body_bytes = CASE WHEN excluded.body IS NULL THEN messages.body_bytes
+                                      ELSE excluded.body_bytes END,
+                    last_access = excluded.last_access
+                """,
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def update_labels(self, msg_ids, add=(), remove=()) -> None:
+        """Apply a label change we just made through the API to whichever of msg_ids are cached."""
+        with self._lock:
+            for i in range(0, len(msg_ids), 500):
+                chunk = list(msg_ids[i:i + 500])
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, labels FROM messages WHERE id IN ({marks})", chunk
+                ).fetchall()
+                updates = []
+                for msg_id, labels in rows:
+                    labels = [l for l in json.loads(labels or "[]") if l not in remove]
+                    labels += [l for l in add if l not in labels]
+                    updates.append((json.dumps(labels), msg_id))
+                self._conn.executemany("UPDATE messages SET labels = ? WHERE id = ?", updates)
+            self._conn.commit()
+
+    def delete_many(self, msg_ids) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", [(m,) for m in msg_ids])
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least recently used bodies, then rows, until both bounds hold."""
+        total = self._conn.execute("SELECT COALESCE(SUM(body_bytes), 0) FROM messages").fetchone()[0]
+        if total > self.max_body_bytes:
+            rows = self._conn.execute(
+                "SELECT id, body_bytes FROM messages WHERE body IS NOT NULL ORDER BY last_access"
+            ).fetchall()
+            evict = []
+            for msg_id, size in rows:
+                if total <= self.max_body_bytes:
+                    break
+                evict.append((msg_id,))
+                total -= size
+            self._conn.executemany("UPDATE messages SET body = NULL, body_bytes = 0 WHERE id = ?", evict)
+
+        count = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        if count > self.max_messages:
+            self._conn.execute(
+                "DELETE FROM messages WHERE id IN "
+                "(SELECT id FROM messages ORDER BY last_access LIMIT ?)",
+                (count - self.max_messages,),
+            )
+
+    # ───── Search ─────
+
+    @staticmethod
+    def _parse_query(query: str, label_ids: dict = None):
+        """
+        Split a Gmail-style query into (FTS5 match expression, label filters,
+        excluded FTS5 terms, excluded labels).
+
+        Supports bare terms, "quoted phrases", trailing * for prefixes,
+        from:/subject:/body: column filters, is:/label: label filters, and a
+        leading - to exclude any of these. label: takes a label name (looked up
+        in label_ids, {lowercase name: id}, with - standing for a space as in
+        Gmail) or a system label id. Other Gmail operators (to:, after:, has:,
+        in:, ...) raise ValueError, as the cache cannot evaluate them.
+        """
+        label_ids = label_ids or {}
+        terms, labels = [], []
+        not_terms, not_labels = [], []
+        for token in _TOKEN.findall(query):
+            negate = token.startswith("-") and len(token) > 1
+            if negate:
+                token = token[1:]
+            field, sep, value = token.partition(":")
+            field = field.lower()
+            if not sep or not value or field.startswith('"'):
+                field, value = None, token
+            if field in _UNSUPPORTED_OPERATORS:
+                raise ValueError(
+                    f"Unsupported operator '{field}:' in cached search; use from:, subject:, body:, "
+                    f"is: or label:, or search the mailbox with gmail_list_emails"
+                )
+            prefix = value.endswith("*")
+            value = value.rstrip("*")
+            if len(value) > 1 and value.startswith('"') and value.endswith('"'):
+                value = value[1:-1]
+            if field == "is":
+                (not_labels if negate else labels).append(value.upper())
+                continue
+            if field == "label":
+                name = value.lower()
+                label = label_ids.get(name) or label_ids.get(name.replace("-", " ")) or value.upper()
+                (not_labels if negate else labels).append(label)
+                continue
+            if not value:
+                continue
+            term = '"' + value.replace('"', '""') + '"' + ("*" if prefix else "")
+            if field in _FTS_COLUMNS:
+                term = f"{_FTS_COLUMNS[field]} : {term}"
+            (not_terms if negate else terms).append(term)
+        return " AND ".join(terms), labels, not_terms, not_labels
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """Return cached messages matching query, best matches first."""
+        with self._lock:
+            label_ids = json.loads(self._get_meta("label_ids") or "{}")
+        match, labels, not_terms, not_labels = self._parse_query(query, label_ids)
+        clauses = []
+        params = []
+        if match:
+            clauses.append("messages_fts MATCH ?")
+            params.append(match)
+        for label in labels:
+            clauses.append("m.labels LIKE ?")
+            params.append(f'%"{label}"%')
+        # FTS5 has no unary NOT, so exclusions filter rows through a subquery
+        for term in not_terms:
+            clauses.append("m.rowid NOT IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+            params.append(term)
+        for label in not_labels:
+            clauses.append("m.labels NOT LIKE ?")
+            params.append(f'%"{label}"%')
+        if not clauses:
+            return []
+        columns = ", ".join(f"m.{f}" for f in _FIELDS)
+        if match:
+            weights = ", ".join(str(w) for w in _FTS_WEIGHTS)
+            sql = (
+                f"SELECT {columns} FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+                f"WHERE {' AND '.join(clauses)} ORDER BY bm25(messages_fts, {weights}) LIMIT ?"
+            )
+        else:
+            sql = (
+                f"SELECT {columns} FROM messages m "
+                f"WHERE {' AND '.join(clauses)} ORDER BY m.last_access DESC LIMIT ?"
+            )
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    # ───── Sync ─────
+
+    def _get_meta(self, key: str):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def has_label_names(self) -> bool:
+        with self._lock:
+            return self._get_meta("label_ids") is not None
+
+    def set_label_names(self, labels) -> None:
+        """Remember the mailbox's labels (users.labels.list resources) so label: filters accept names."""
+        label_ids = {label["name"].lower(): label["id"] for label in labels}
+        with self._lock:
+            self._set_meta("label_ids", json.dumps(label_ids))
+            self._conn.commit()
+
+    def is_fresh(self) -> bool:
+        return time.time() - self._last_sync < SYNC_INTERVAL
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM messages")
+            self._conn.execute("DELETE FROM meta WHERE key = 'history_id'")
+            self._conn.commit()
+            self._last_sync = 0.0
+
+    def sync(self, service) -> int:
+        """
+        Apply mailbox changes since the stored historyId.
+
+        The first sync only records the current historyId; messages enter the
+        store as they are fetched. Returns the number of history records applied.
+        The history is paged in without holding the store lock, so cached reads
+        are not blocked by the network; the records are applied in one go.
+        """
+        with self._sync_lock:
+            return self._sync(service)
+
+    def _sync(self, service) -> int:
+        """sync() body; the caller holds the sync lock."""
+        with self._lock:
+            start = self._get_meta("history_id")
+        if start is None:
+            profile = service.users().getProfile(userId='me').execute()
+            with self._lock:
+                self._set_meta("history_id", str(profile["historyId"]))
+                self._conn.commit()
+                self._last_sync = time.time()
+            return 0
+
+        records = []
+        latest = start
+        page_token = None
+        try:
+            while True:
+                kwargs = {"userId": "me", "startHistoryId": start}
+                if page_token:
+                    kwargs["pageToken"] = page_token
+                resp = service.users().history().list(**kwargs).execute()
+                records.extend(resp.get("history", []))
+                latest = resp.get("historyId", latest)
+                page_token = resp.get("nextPageToken")
+                if not page_token:
+                    break
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # startHistoryId is too old to replay: start over from scratch
+            self.clear()
+            return self._sync(service)
+
+        with self._lock:
+            for record in records:
+                self._apply_history(record)
+            self._set_meta("history_id", str(latest))
+            self._conn.commit()
+            self._last_sync = time.time()
+        return len(records)
+
+    def _apply_history(self, record: dict) -> None:
+        for item in record.get("messagesDeleted", []):
+            self._conn.execute("DELETE FROM messages WHERE id = ?", (item["message"]["id"],))
+        for key in ("labelsAdded", "labelsRemoved"):
+            for item in record.get(key, []):
+                message = item["message"]
+                if "labelIds" in message:
+                    self._conn.execute(
+                        "UPDATE messages SET labels = ? WHERE id = ?",
+                        (json.dumps(message["labelIds"]), message["id"]),
+                    )
+
+    def ensure_fresh(self, service) -> None:
+        """Sync with Gmail unless the last sync is recent enough."""
+        if self.is_fresh():
+            return
+        with self._sync_lock:
+            # Callers that found the store stale together share the first one's sync
+            if not self.is_fresh():
+                self._sync(service)
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, bodies, size = self._conn.execute(
+                "SELECT COUNT(*), COUNT(body), COALESCE(SUM(body_bytes), 0) FROM messages"
+            ).fetchone()
+            return {
+                "messages": count,
+                "bodies": bodies,
+                "body_bytes": size,
+                "history_id": self._get_meta("history_id"),
+                "fresh": self.is_fresh(),
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> MailStore:
+    """Return the process-wide mail store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MailStore()
+        return _store
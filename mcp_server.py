@@ -2,17 +2,23 @@
 Alfred MCP Server - Gmail and Calendar tools for Claude Code
 """
 
+import asyncio
+import datetime
 from fastmcp import FastMCP
 from typing import Optional
 import google_utils
+import mail_store
+import metrics
+from tool_runner import run_blocking
 
 mcp = FastMCP("alfred")
+metrics.SERVER_NAME = "alfred"
 
 
 # ───── Gmail Tools ─────
 
 @mcp.tool()
-def gmail_list_emails(query: str = "is:unread", max_results: int = 5) -> str:
+async def gmail_list_emails(query: str = "is:unread", max_results: int = 5) -> str:
     """
     Search and list emails from Gmail.
 
@@ -24,7 +30,10 @@ def gmail_list_emails(query: str = "is:unread", max_results: int = 5) -> str:
         Formatted list of emails with id, subject, sender, and snippet
     """
     try:
-        emails = google_utils.list_emails(query=query, max_results=max_results)
+        emails = await run_blocking(
+            "gmail", "gmail_list_emails", google_utils.list_emails,
+            query=query, max_results=max_results, include_body=False
+        )
         if not emails:
             return "No emails found matching the query."
 
@@ -42,7 +51,49 @@ def gmail_list_emails(query: str = "is:unread", max_results: int = 5) -> str:
 
 
 @mcp.tool()
-def gmail_get_email(email_id: str) -> str:
+async def gmail_list_emails_page(query: str = "is:unread", page_size: int = 25, page_token: Optional[str] = None) -> str:
+    """
+    List one page of emails matching a query, with a token to fetch the next page.
+
+    Use this to walk through large result sets: call again with the returned
+    page token until no token is returned.
+
+    Args:
+        query: Gmail search query (e.g., "is:unread", "from:someone@email.com")
+        page_size: Number of emails per page (default: 25, max: 500)
+        page_token: Continuation token from a previous call (omit for the first page)
+
+    Returns:
+        Formatted list of emails, followed by the next page token if there are more
+    """
+    try:
+        emails, next_token = await run_blocking(
+            "gmail", "gmail_list_emails_page", google_utils.get_email_page,
+            query=query, page_size=page_size, page_token=page_token
+        )
+        if not emails and not next_token:
+            return "No emails found matching the query."
+
+        result = []
+        for email in emails:
+            result.append(
+                f"ID: {email['id']}\n"
+                f"From: {email['from']}\n"
+                f"Subject: {email['subject']}\n"
+                f"Snippet: {email['snippet']}\n"
+            )
+        output = "\n---\n".join(result)
+        if next_token:
+            output += f"\n\nNext page token: {next_token}"
+        else:
+            output += "\n\n(Last page)"
+        return output
+    except Exception as e:
+        return f"Error listing emails: {str(e)}"
+
+
+@mcp.tool()
+async def gmail_get_email(email_id: str) -> str:
     """
     Get the full content of a specific email by ID.
 
@@ -53,7 +104,7 @@ def gmail_get_email(email_id: str) -> str:
         Full email details including body
     """
     try:
-        email = google_utils.get_email_by_id(email_id)
+        email = await run_blocking("gmail", "gmail_get_email", google_utils.get_email_by_id, email_id)
         if not email:
             return f"Email with ID {email_id} not found."
 
@@ -69,7 +120,44 @@ def gmail_get_email(email_id: str) -> str:
 
 
 @mcp.tool()
-def gmail_mark_as_read(email_id: str) -> str:
+async def gmail_search_cached(query: str, max_results: int = 10) -> str:
+    """
+    Full-text search over emails already cached locally (no Gmail API call).
+
+    Only covers messages previously listed or opened. Use gmail_list_emails
+    for a complete search of the mailbox.
+
+    Args:
+        query: Search terms; supports "quoted phrases", prefix*, and filters
+               from:, subject:, body:, is:unread, label:<name or id>; a leading
+               - excludes (-from:alice). Other Gmail operators are rejected
+        max_results: Maximum number of emails to return (default: 10)
+
+    Returns:
+        Ranked list of matching emails with id, subject, sender, and snippet
+    """
+    try:
+        emails = await run_blocking(
+            "gmail", "gmail_search_cached", google_utils.search_cached_emails, query, max_results=max_results
+        )
+        if not emails:
+            return "No cached emails match the query."
+
+        result = []
+        for email in emails:
+            result.append(
+                f"ID: {email['id']}\n"
+                f"From: {email['from']}\n"
+                f"Subject: {email['subject']}\n"
+                f"Snippet: {email['snippet']}\n"
+            )
+        return "\n---\n".join(result)
+    except Exception as e:
+        return f"Error searching cached emails: {str(e)}"
+
+
+@mcp.tool()
+async def gmail_mark_as_read(email_id: str) -> str:
     """
     Mark an email as read.
 
@@ -80,14 +168,14 @@ def gmail_mark_as_read(email_id: str) -> str:
         Confirmation message
     """
     try:
-        google_utils.mark_as_read(email_id)
+        await run_blocking("gmail", "gmail_mark_as_read", google_utils.mark_as_read, email_id)
         return f"Email {email_id} marked as read."
     except Exception as e:
         return f"Error marking email as read: {str(e)}"
 
 
 @mcp.tool()
-def gmail_star_email(email_id: str) -> str:
+async def gmail_star_email(email_id: str) -> str:
     """
     Star an email for follow-up.
 
@@ -98,14 +186,65 @@ def gmail_star_email(email_id: str) -> str:
         Confirmation message
     """
     try:
-        google_utils.star_email(email_id)
+        await run_blocking("gmail", "gmail_star_email", google_utils.star_email, email_id)
         return f"Email {email_id} starred."
     except Exception as e:
         return f"Error starring email: {str(e)}"
 
 
 @mcp.tool()
-def gmail_send_email(to: str, subject: str, body: str, cc: Optional[str] = None, bcc: Optional[str] = None) -> str:
+async def gmail_bulk_modify_labels(
+    email_ids: Optional[str] = None,
+    query: Optional[str] = None,
+    add_labels: Optional[str] = None,
+    remove_labels: Optional[str] = None,
+    max_messages: int = 1000
+) -> str:
+    """
+    Add or remove labels on many emails at once.
+
+    Common uses: mark read (remove_labels="UNREAD"), archive (remove_labels="INBOX"),
+    star (add_labels="STARRED"), unstar (remove_labels="STARRED"),
+    apply a user label (add_labels="Referee").
+
+    Args:
+        email_ids: Optional comma-separated Gmail message IDs
+        query: Optional Gmail search query selecting the emails (e.g., "is:unread from:newsletter@x.com")
+        add_labels: Optional comma-separated label names or IDs to add
+        remove_labels: Optional comma-separated label names or IDs to remove
+        max_messages: Maximum number of emails matched by query (default: 1000)
+
+    Returns:
+        Per-chunk summary of the modifications
+    """
+    try:
+        def split(value):
+            return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+        results = await run_blocking(
+            "gmail", "gmail_bulk_modify_labels", google_utils.bulk_modify_labels,
+            msg_ids=split(email_ids),
+            query=query,
+            add_labels=split(add_labels),
+            remove_labels=split(remove_labels),
+            max_messages=max_messages
+        )
+        if not results:
+            return "No emails matched."
+
+        lines = []
+        for r in results:
+            status = "ok" if r['ok'] else f"failed: {r['error']}"
+            lines.append(f"Chunk {r['chunk']}: {r['count']} emails {status}")
+        modified = sum(r['count'] for r in results if r['ok'])
+        lines.append(f"Modified {modified} of {sum(r['count'] for r in results)} emails.")
+        return "\n".join(lines)
+    except Exception as e:
+        return f"Error modifying labels: {str(e)}"
+
+
+@mcp.tool()
+async def gmail_send_email(to: str, subject: str, body: str, cc: Optional[str] = None, bcc: Optional[str] = None) -> str:
     """
     Send an email.
 
@@ -120,7 +259,9 @@ def gmail_send_email(to: str, subject: str, body: str, cc: Optional[str] = None,
         Confirmation message
     """
     try:
-        google_utils.send_email(to=to, subject=subject, body_text=body, cc=cc, bcc=bcc)
+        await run_blocking(
+            "gmail", "gmail_send_email", google_utils.send_email, to=to, subject=subject, body_text=body, cc=cc, bcc=bcc
+        )
         return f"Email sent to {to} with subject: {subject}"
     except Exception as e:
         return f"Error sending email: {str(e)}"
@@ -129,37 +270,126 @@ def gmail_send_email(to: str, subject: str, body: str, cc: Optional[str] = None,
 # ───── Calendar Tools ─────
 
 @mcp.tool()
-def calendar_get_events(start_date: str, end_date: str) -> str:
+async def calendar_get_events(start_date: str, end_date: str, calendars: Optional[str] = None) -> str:
     """
     Get calendar events between two dates.
 
     Args:
         start_date: Start date in YYYY-MM-DD format
         end_date: End date in YYYY-MM-DD format
+        calendars: Optional comma-separated calendar IDs, or "all" for every calendar
+                   shown in Google Calendar (default: the CALENDAR_IDS setting, else primary)
 
     Returns:
         Formatted list of events
     """
     try:
-        events = google_utils.get_events_between_dates(start_date, end_date)
+        events = await run_blocking(
+            "calendar", "calendar_get_events", google_utils.get_events_between_dates,
+            start_date, end_date, calendar_ids=calendars
+        )
         if not events:
             return f"No events found between {start_date} and {end_date}."
 
         result = []
         for event in events:
-            result.append(
+            entry = (
                 f"ID: {event['id']}\n"
                 f"Event: {event['summary']}\n"
                 f"Start: {event['start']}\n"
                 f"End: {event['end']}"
             )
+            if event['calendar_id'] != 'primary':
+                entry += f"\nCalendar: {event['calendar_id']}"
+            result.append(entry)
         return "\n---\n".join(result)
     except Exception as e:
         return f"Error fetching events: {str(e)}"
 
 
 @mcp.tool()
-def calendar_create_event(
+async def calendar_check_conflicts(start_time: str, end_time: str, attendees: Optional[str] = None) -> str:
+    """
+    Check whether a proposed time slot conflicts with existing commitments.
+
+    Args:
+        start_time: Start time in ISO format (YYYY-MM-DDTHH:MM:SS)
+        end_time: End time in ISO format (YYYY-MM-DDTHH:MM:SS)
+        attendees: Optional comma-separated attendee emails whose calendars should also be checked
+
+    Returns:
+        Busy periods overlapping the slot, per calendar, or confirmation that it is free
+    """
+    try:
+        attendees_list = [e.strip() for e in attendees.split(",")] if attendees else None
+        conflicts, errors = await run_blocking(
+            "calendar", "calendar_check_conflicts", google_utils.find_conflicts, start_time, end_time, attendees_list
+        )
+
+        lines = []
+        for cal_id, busy in conflicts.items():
+            who = "You" if cal_id == "primary" else cal_id
+            periods = ", ".join(f"{s} to {e}" for s, e in busy)
+            lines.append(f"{who}: busy {periods}")
+        for cal_id, reason in errors.items():
+            lines.append(f"{cal_id}: availability unknown ({reason})")
+        if not conflicts:
+            lines.insert(0, f"No conflicts between {start_time} and {end_time}.")
+        return "\n".join(lines)
+    except Exception as e:
+        return f"Error checking conflicts: {str(e)}"
+
+
+@mcp.tool()
+async def calendar_find_free_slots(
+    start_time: str,
+    end_time: str,
+    duration_minutes: int = 30,
+    count: int = 5,
+    attendees: Optional[str] = None,
+    day_start: str = "09:00",
+    day_end: str = "18:00",
+    include_weekends: bool = False
+) -> str:
+    """
+    Find free time slots for a meeting, optionally across attendees' calendars.
+
+    Args:
+        start_time: Start of the search range in ISO format (YYYY-MM-DDTHH:MM:SS)
+        end_time: End of the search range in ISO format (YYYY-MM-DDTHH:MM:SS)
+        duration_minutes: Meeting length in minutes (default: 30)
+        count: Number of slots to propose (default: 5)
+        attendees: Optional comma-separated attendee emails who must also be free
+        day_start: Start of working hours, HH:MM (default: 09:00)
+        day_end: End of working hours, HH:MM (default: 18:00)
+        include_weekends: Also propose slots on Saturday and Sunday (default: False)
+
+    Returns:
+        List of proposed free slots
+    """
+    try:
+        attendees_list = [e.strip() for e in attendees.split(",")] if attendees else None
+        slots, errors = await run_blocking(
+            "calendar", "calendar_find_free_slots", google_utils.find_free_slots,
+            start_time, end_time,
+            duration_minutes=duration_minutes,
+            count=count,
+            attendees_emails=attendees_list,
+            day_start=day_start,
+            day_end=day_end,
+            include_weekends=include_weekends
+        )
+
+        lines = [f"{s} to {e}" for s, e in slots] or ["No free slots found in that range."]
+        for cal_id, reason in errors.items():
+            lines.append(f"Note: availability of {cal_id} unknown ({reason})")
+        return "\n".join(lines)
+    except Exception as e:
+        return f"Error finding free slots: {str(e)}"
+
+
+@mcp.tool()
+async def calendar_create_event(
     title: str,
     start_time: str,
     end_time: str,
@@ -181,7 +411,8 @@ def calendar_create_event(
     """
     try:
         attendees_list = [e.strip() for e in attendees.split(",")] if attendees else None
-        result = google_utils.create_event(
+        result = await run_blocking(
+            "calendar", "calendar_create_event", google_utils.create_event,
             summary=title,
             start_time=start_time,
             end_time=end_time,
@@ -194,7 +425,7 @@ def calendar_create_event(
 
 
 @mcp.tool()
-def calendar_update_event(
+async def calendar_update_event(
     event_id: str,
     title: Optional[str] = None,
     start_time: Optional[str] = None,
@@ -215,7 +446,8 @@ def calendar_update_event(
         Confirmation message
     """
     try:
-        return google_utils.update_event(
+        return await run_blocking(
+            "calendar", "calendar_update_event", google_utils.update_event,
             event_id=event_id,
             summary=title,
             start_time=start_time,
@@ -227,7 +459,7 @@ def calendar_update_event(
 
 
 @mcp.tool()
-def calendar_delete_event(event_id: str) -> str:
+async def calendar_delete_event(event_id: str) -> str:
     """
     Delete a calendar event.
 
@@ -238,10 +470,129 @@ def calendar_delete_event(event_id: str) -> str:
         Confirmation message
     """
     try:
-        return google_utils.delete_event(event_id)
+        return await run_blocking("calendar", "calendar_delete_event", google_utils.delete_event, event_id)
     except Exception as e:
         return f"Error deleting event: {str(e)}"
 
 
+# ───── Briefing ─────
+
+BRIEFING_SECTIONS = ("unread", "starred", "today", "tomorrow", "week")
+
+
+def _format_email_lines(emails):
+    return [f"- {email['from']}: {email['subject']} [{email['id']}]" for email in emails]
+
+
+def _format_event_lines(events, with_date=False):
+    lines = []
+    for event in events:
+        start = event['start'][11:16] or "all day"
+        end = event['end'][11:16]
+        when = f"{start}-{end}" if end else start
+        if with_date:
+            when = f"{event['start'][:10]} {when}"
+        lines.append(f"- {when} {event['summary']} [{event['id']}]")
+    return lines
+
+
+@mcp.tool()
+async def daily_briefing(sections: str = "unread,today,tomorrow", max_emails: int = 10, timeout: float = 20.0) -> str:
+    """
+    One-shot daily briefing: unread mail and upcoming agenda, gathered in parallel.
+
+    Args:
+        sections: Comma-separated sections to include, from
+                  unread, starred, today, tomorrow, week (next 7 days)
+        max_emails: Maximum emails listed per mail section (default: 10)
+        timeout: Seconds to wait for each section before reporting it as timed out (default: 20)
+
+    Returns:
+        Compact digest with one block per section
+    """
+    requested = [s.strip().lower() for s in sections.split(",") if s.strip()]
+    unknown = [s for s in requested if s not in BRIEFING_SECTIONS]
+    if unknown:
+        return f"Unknown section(s): {', '.join(unknown)}. Choose from: {', '.join(BRIEFING_SECTIONS)}"
+
+    today = datetime.datetime.now(google_utils.LOCAL_TZ).date()
+    tomorrow = today + datetime.timedelta(days=1)
+    jobs = {
+        "unread": ("gmail", google_utils.list_emails,
+                   {"query": "is:unread", "max_results": max_emails, "include_body": False}),
+        "starred": ("gmail", google_utils.list_emails,
+                    {"query": "is:starred", "max_results": max_emails, "include_body": False}),
+        "today": ("calendar", google_utils.get_events_between_dates,
+                  {"start_date": today.isoformat(), "end_date": today.isoformat()}),
+        "tomorrow": ("calendar", google_utils.get_events_between_dates,
+                     {"start_date": tomorrow.isoformat(), "end_date": tomorrow.isoformat()}),
+        "week": ("calendar", google_utils.get_events_between_dates,
+                 {"start_date": today.isoformat(),
+                  "end_date": (today + datetime.timedelta(days=6)).isoformat()}),
+    }
+    titles = {
+        "unread": "Unread emails",
+        "starred": "Starred emails",
+        "today": f"Today ({today.isoformat()})",
+        "tomorrow": f"Tomorrow ({tomorrow.isoformat()})",
+        "week": "Next 7 days",
+    }
+
+    async def run_section(name):
+        backend, func, kwargs = jobs[name]
+        return await asyncio.wait_for(run_blocking(backend, f"daily_briefing.{name}", func, **kwargs), timeout)
+
+    results = await asyncio.gather(*(run_section(name) for name in requested), return_exceptions=True)
+
+    blocks = []
+    for name, result in zip(requested, results):
+        if isinstance(result, asyncio.TimeoutError):
+            body = [f"(timed out after {timeout:g}s)"]
+        elif isinstance(result, Exception):
+            body = [f"(error: {result})"]
+        elif not result:
+            body = ["(none)"]
+        elif jobs[name][0] == "gmail":
+            body = _format_email_lines(result)
+        else:
+            body = _format_event_lines(result, with_date=(name == "week"))
+        blocks.append(f"## {titles[name]}\n" + "\n".join(body))
+    return "\n\n".join(blocks)
+
+
+# ───── Diagnostics ─────
+
+@mcp.tool()
+async def alfred_stats(reset: bool = False) -> str:
+    """
+    Show latency and call-count statistics for this server.
+
+    Covers each tool call, every Gmail/Calendar HTTP request (by API method),
+    and service build / token refresh, plus service and mail cache counters.
+
+    Args:
+        reset: Clear the recorded statistics after reporting them (default: False)
+
+    Returns:
+        Summary table of counts, average/p95/max latency and payload bytes
+    """
+    try:
+        cache = google_utils.service_cache_stats()
+        store = mail_store.get_store().stats()
+        report = (
+            f"{metrics.render_text()}\n\n"
+            f"Service cache: {cache['hits']} hits, {cache['builds']} builds, "
+            f"{cache['refreshes']} token refreshes, {cache['invalidations']} invalidations\n"
+            f"Mail cache: {store['messages']} messages, {store['bodies']} bodies "
+            f"({store['body_bytes']} bytes)"
+        )
+        metrics.write_prometheus()
+        if reset:
+            metrics.reset()
+        return report
+    except Exception as e:
+        return f"Error reading stats: {str(e)}"
+
+
 if __name__ == "__main__":
     mcp.run()
@@ -0,0 +1,191 @@
+"""
+Lightweight in-process counters and latency histograms for the MCP servers.
+
+Timings are recorded per (kind, name, tool): kind is "tool", "http", "git",
+"google" or "quota", name is the tool function, API method id or git
+subcommand, and tool is the tool call the work was done for. Set ALFRED_METRICS=0 to turn recording
+off entirely. If ALFRED_METRICS_DIR is set, each server writes its series to
+<dir>/alfred_<server>.prom in the Prometheus text format (suitable for a
+node_exporter textfile collector) whenever stats are read and at exit.
+"""
+
+import atexit
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.getenv("ALFRED_METRICS", "1").lower() not in ("0", "false", "no", "off")
+PROMETHEUS_DIR = os.getenv("ALFRED_METRICS_DIR")
+# Set by each MCP server so the two processes write separate files
+SERVER_NAME = "alfred"
+
+# Histogram bucket upper bounds in seconds (Prometheus convention)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Name of the tool call currently being served, for attributing upstream work
+current_tool = contextvars.ContextVar("current_tool", default="-")
+
+_lock = threading.Lock()
+_series = {}
+
+
+class _Series:
+    __slots__ = ("count", "errors", "total", "max", "bytes", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+
+def observe(kind: str, name: str, seconds: float, nbytes: int = 0, error: bool = False) -> None:
+    """Record one timed operation."""
+    if not ENABLED:
+        return
+    key = (kind, name, current_tool.get())
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = _Series()
+        series.count += 1
+        series.errors += error
+        series.total += seconds
+        series.max = max(series.max, seconds)
+        series.bytes += nbytes
+        series.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+
+@contextmanager
+def timed(kind: str, name: str):
+    """Time the enclosed block; the yielded dict may set "bytes" for payload size."""
+    if not ENABLED:
+        yield {}
+        return
+    info = {"bytes": 0}
+    start = time.perf_counter()
+    error = False
+    try:
+        yield info
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(kind, name, time.perf_counter() - start, info["bytes"], error)
+
+
+def reset() -> None:
+    with _lock:
+        _series.clear()
+
+
+def snapshot() -> list[dict]:
+    """Return one dict per series, sorted by kind, name and tool."""
+    with _lock:
+        items = sorted(_series.items())
+        return [
+            {
+                "kind": kind, "name": name, "tool": tool,
+                "count": s.count, "errors": s.errors, "total": s.total, "max": s.max,
+                "bytes": s.bytes, "buckets": list(s.buckets),
+            }
+            for (kind, name, tool), s in items
+        ]
+
+
+def _quantile(buckets, count, q):
+    """Upper bucket bound below which a fraction q of observations fall."""
+    target = q * count
+    seen = 0
+    for bound, n in zip(BUCKETS + (float("inf"),), buckets):
+        seen += n
+        if seen >= target:
+            return bound
+    return float("inf")
+
+
+def render_text() -> str:
+    """Human-readable summary table, aggregated per kind and name."""
+    if not ENABLED:
+        return "Metrics are disabled (ALFRED_METRICS=0)."
+    rows = snapshot()
+    if not rows:
+        return "No calls recorded yet."
+    merged = {}
+    calls_by_tool = {}
+    for row in rows:
+        key = (row["kind"], row["name"])
+        m = merged.setdefault(key, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0, "bytes": 0,
+                                    "buckets": [0] * (len(BUCKETS) + 1)})
+        m["count"] += row["count"]
+        m["errors"] += row["errors"]
+        m["total"] += row["total"]
+        m["max"] = max(m["max"], row["max"])
+        m["bytes"] += row["bytes"]
+        m["buckets"] = [a + b for a, b in zip(m["buckets"], row["buckets"])]
+        if row["kind"] in ("http", "git"):
+            calls_by_tool[row["tool"]] = calls_by_tool.get(row["tool"], 0) + row["count"]
+
+    lines = [f"{'kind':<7} {'name':<42} {'count':>6} {'err':>4} {'avg ms':>8} {'p95 ms':>8} {'max ms':>8} {'bytes':>10}"]
+    for (kind, name), m in sorted(merged.items()):
+        avg = 1000 * m["total"] / m["count"]
+        p95 = 1000 * _quantile(m["buckets"], m["count"], 0.95)
+        lines.append(
+            f"{kind:<7} {name[:42]:<42} {m['count']:>6} {m['errors']:>4} {avg:>8.1f} "
+            f"{'inf' if p95 == float('inf') else f'<={p95:.0f}':>8} {1000 * m['max']:>8.1f} {m['bytes']:>10}"
+        )
+    if calls_by_tool:
+        lines.append("")
+        lines.append("Upstream calls per tool:")
+        for tool, n in sorted(calls_by_tool.items(), key=lambda item: -item[1]):
+            lines.append(f"  {tool}: {n}")
+    return "\n".join(lines)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_prometheus() -> str:
+    """Render all series in the Prometheus text exposition format."""
+    out = [
+        "# HELP alfred_duration_seconds Latency of tool calls and upstream operations.",
+        "# TYPE alfred_duration_seconds histogram",
+    ]
+    errors = []
+    payload = []
+    for row in snapshot():
+        labels = f'kind="{row["kind"]}",name="{_escape(row["name"])}",tool="{_escape(row["tool"])}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS, row["buckets"]):
+            cumulative += n
+            out.append(f'alfred_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        out.append(f'alfred_duration_seconds_bucket{{{labels},le="+Inf"}} {row["count"]}')
+        out.append(f"alfred_duration_seconds_sum{{{labels}}} {row['total']}")
+        out.append(f"alfred_duration_seconds_count{{{labels}}} {row['count']}")
+        errors.append(f"alfred_errors_total{{{labels}}} {row['errors']}")
+        payload.append(f"alfred_payload_bytes_total{{{labels}}} {row['bytes']}")
+    out += ["# HELP alfred_errors_total Operations that raised.", "# TYPE alfred_errors_total counter"] + errors
+    out += ["# HELP alfred_payload_bytes_total Response payload bytes.", "# TYPE alfred_payload_bytes_total counter"]
+    out += payload
+    return "\n".join(out) + "\n"
+
+
+def write_prometheus(path=None) -> None:
+    """Atomically write the Prometheus text file, if one is configured."""
+    if path is None and PROMETHEUS_DIR:
+        path = os.path.join(PROMETHEUS_DIR, f"alfred_{SERVER_NAME}.prom")
+    if not ENABLED or not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+atexit.register(write_prometheus)
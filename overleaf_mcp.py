@@ -2,14 +2,32 @@
 Overleaf MCP Server - Read/write access to Overleaf projects via Git
 """
 
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
 from fastmcp import FastMCP
+import latex_graph
+import metrics
+import overleaf_search
 import overleaf_utils
+import push_queue
+import sync_scheduler
+from tool_runner import run_blocking
+
+@asynccontextmanager
+async def lifespan(server):
+    # Keep checkouts fresh in the background while the server runs
+    sync_scheduler.start()
+    yield
 
-mcp = FastMCP("overleaf")
+
+mcp = FastMCP("overleaf", lifespan=lifespan)
+metrics.SERVER_NAME = "overleaf"
 
 
 @mcp.tool()
-def overleaf_list_projects() -> str:
+async def overleaf_list_projects() -> str:
     """
     List all configured Overleaf projects.
 
@@ -17,24 +35,28 @@ def overleaf_list_projects() -> str:
         Formatted list of projects with their IDs and local paths
     """
     try:
-        projects = overleaf_utils.list_projects()
+        projects = await run_blocking("overleaf", "overleaf_list_projects", overleaf_utils.list_projects)
         if not projects:
             return "No projects configured. Use overleaf_add_project to add one."
 
         result = []
         for name, info in projects.items():
-            result.append(
+            entry = (
                 f"Name: {name}\n"
                 f"Project ID: {info['project_id']}\n"
                 f"Local Path: {info['local_path']}"
             )
+            sync_note = sync_scheduler.describe(name)
+            if sync_note:
+                entry += f"\n{sync_note}"
+            result.append(entry)
         return "\n---\n".join(result)
     except Exception as e:
         return f"Error listing projects: {str(e)}"
 
 
 @mcp.tool()
-def overleaf_add_project(name: str, project_id: str) -> str:
+async def overleaf_add_project(name: str, project_id: str) -> str:
     """
     Add a new Overleaf project to the configuration.
 
@@ -46,68 +68,247 @@ def overleaf_add_project(name: str, project_id: str) -> str:
         Confirmation message
     """
     try:
-        return overleaf_utils.add_project(name, project_id)
+        return await run_blocking("overleaf", "overleaf_add_project", overleaf_utils.add_project, name, project_id)
     except Exception as e:
         return f"Error adding project: {str(e)}"
 
 
 @mcp.tool()
-def overleaf_pull(project: str) -> str:
+async def overleaf_pull(project: str, depth: Optional[int] = None) -> str:
     """
     Pull latest changes from Overleaf. Clones the project if not already local.
 
     Args:
         project: The project name (as configured)
+        depth: Optional history depth for a new clone (e.g., 1 for the latest
+            snapshot only); ignored when the project is already cloned
 
     Returns:
         Status message with pull/clone result
     """
     try:
-        return overleaf_utils.clone_or_pull(project)
+        message = await run_blocking("overleaf", "overleaf_pull", overleaf_utils.clone_or_pull, project, depth)
+        if not message.startswith("Error"):
+            sync_scheduler.record_pull(project)
+        return message
     except Exception as e:
         return f"Error pulling project: {str(e)}"
 
 
 @mcp.tool()
-def overleaf_list_files(project: str) -> str:
+async def overleaf_sync_all() -> str:
+    """
+    Clone or pull every configured Overleaf project, several at a time.
+
+    Returns:
+        One line per project with its status and how long it took
+    """
+    try:
+        results = await run_blocking("overleaf", "overleaf_sync_all", overleaf_utils.sync_all_projects)
+        if not results:
+            return "No projects configured. Use overleaf_add_project to add one."
+        lines = []
+        for r in results:
+            # First line of a success message, last (the git error) of a failure
+            message_lines = r["message"].strip().splitlines() or [""]
+            summary = message_lines[0] if r["ok"] else message_lines[-1]
+            lines.append(f"[{'ok' if r['ok'] else 'FAILED'}] {r['project']} ({r['seconds']:.1f}s): {summary}")
+        failed = sum(not r["ok"] for r in results)
+        total = max(r["seconds"] for r in results)
+        lines.append(f"\n{len(results) - failed}/{len(results)} projects synced in {total:.1f}s")
+        return "\n".join(lines)
+    except Exception as e:
+        return f"Error syncing projects: {str(e)}"
+
+
+@mcp.tool()
+async def overleaf_list_files(
+    project: str,
+    pattern: Optional[str] = None,
+    extensions: Optional[str] = None,
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    refresh: bool = False,
+) -> str:
     """
-    List all files in an Overleaf project.
+    List all files in an Overleaf project (tracked plus untracked, non-ignored files).
 
     Args:
         project: The project name (as configured)
+        pattern: Optional glob on the relative path (e.g., "chapters/*.tex")
+        extensions: Optional comma-separated extensions to keep (e.g., "tex,bib")
+        min_size: Optional minimum file size in bytes
+        max_size: Optional maximum file size in bytes
+        refresh: Rescan even if git state is unchanged, to pick up files created
+            outside these tools (default: False)
 
     Returns:
-        List of file paths in the project
+        List of file paths in the project, preceded by a [sync: ...] line saying
+        when the project was last fetched in the background, if it has been
     """
     try:
-        files = overleaf_utils.list_files(project)
+        ext_list = [e.strip() for e in extensions.split(",") if e.strip()] if extensions else None
+        files = await run_blocking(
+            "overleaf", "overleaf_list_files", overleaf_utils.list_files, project,
+            pattern=pattern, extensions=ext_list, min_size=min_size, max_size=max_size, refresh=refresh,
+        )
         if not files:
             return f"No files found in project '{project}'"
-        return "\n".join(files)
+        sync_note = sync_scheduler.describe(project)
+        return "\n".join([sync_note, *files] if sync_note else files)
     except Exception as e:
         return f"Error listing files: {str(e)}"
 
 
 @mcp.tool()
-def overleaf_read_file(project: str, path: str) -> str:
+async def overleaf_read_file(
+    project: str,
+    path: str,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+) -> str:
     """
     Read a file's content from an Overleaf project.
 
     Args:
         project: The project name (as configured)
         path: Path to the file within the project (e.g., "main.tex")
+        start_line: Optional first line to return (1-based)
+        end_line: Optional last line to return (inclusive)
 
     Returns:
-        The file's content
+        The file's content, or only the requested lines. If the background
+        fetch found newer commits on Overleaf that could not be applied, a
+        [sync: ... STALE ...] line is put before the content.
     """
     try:
-        return overleaf_utils.read_file(project, path)
+        content = await run_blocking(
+            "overleaf", "overleaf_read_file", overleaf_utils.read_file, project, path, start_line, end_line
+        )
+        state = sync_scheduler.status(project)
+        if state and state.get("stale"):
+            return f"{sync_scheduler.describe(project)}\n{content}"
+        return content
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
 
 @mcp.tool()
-def overleaf_write_file(project: str, path: str, content: str) -> str:
+async def overleaf_search(
+    project: str,
+    query: str,
+    max_results: int = 50,
+    case_sensitive: bool = False,
+    pattern: Optional[str] = None,
+) -> str:
+    """
+    Search the text files of an Overleaf project (.tex, .bib, .sty, ...) for a string.
+
+    Use this to find labels, citation keys or macro definitions instead of
+    reading every file. Matches whole words, so search for "sec:intro" or
+    "\\newcommand" rather than word fragments.
+
+    Args:
+        project: The project name (as configured)
+        query: Text to find (e.g., "\\label{sec:intro}", "smith2020")
+        max_results: Maximum number of matching lines (default: 50)
+        case_sensitive: Match case exactly (default: False)
+        pattern: Optional glob restricting the files searched (e.g., "chapters/*.tex")
+
+    Returns:
+        Matching lines as "path:line: text"
+    """
+    try:
+        matches = await run_blocking(
+            "overleaf", "overleaf_search", overleaf_search.search, project, query,
+            max_results=max_results, case_sensitive=case_sensitive, pattern=pattern,
+        )
+        if not matches:
+            return f"No matches for '{query}' in project '{project}'"
+        return "\n".join(f"{m['path']}:{m['line']}: {m['text']}" for m in matches)
+    except Exception as e:
+        return f"Error searching project: {str(e)}"
+
+
+def _format_locations(locations):
+    return ", ".join(f"{path}:{line}" for path, line in locations)
+
+
+@mcp.tool()
+async def overleaf_include_tree(project: str) -> str:
+    """
+    Show which files each main document includes (\\input, \\include, \\subfile, \\import).
+
+    Args:
+        project: The project name (as configured)
+
+    Returns:
+        Indented include tree with the line of each include; missing files are marked
+    """
+    try:
+        graph = await run_blocking("overleaf", "overleaf_include_tree", latex_graph.get_graph, project)
+        return graph.include_tree() or f"No .tex files found in project '{project}'"
+    except Exception as e:
+        return f"Error building include tree: {str(e)}"
+
+
+@mcp.tool()
+async def overleaf_resolve(project: str, key: str) -> str:
+    """
+    Find where a label or citation key is defined and everywhere it is used.
+
+    Args:
+        project: The project name (as configured)
+        key: A \\label key (e.g., "sec:intro") or a bibliography key (e.g., "smith2020")
+
+    Returns:
+        Definition and use locations as path:line
+    """
+    try:
+        graph = await run_blocking("overleaf", "overleaf_resolve", latex_graph.get_graph, project)
+        found = graph.resolve(key)
+        lines = []
+        for title, field in (("Label defined at", "labels"), ("Referenced at", "refs"),
+                             ("Bib entry at", "entries"), ("Cited at", "cites")):
+            if found[field]:
+                lines.append(f"{title}: {_format_locations(found[field])}")
+        return "\n".join(lines) or f"'{key}' is neither a label nor a citation key in project '{project}'"
+    except Exception as e:
+        return f"Error resolving key: {str(e)}"
+
+
+@mcp.tool()
+async def overleaf_unresolved(project: str) -> str:
+    """
+    List dangling \\ref and \\cite keys, duplicate labels or bib entries, and missing included files.
+
+    Args:
+        project: The project name (as configured)
+
+    Returns:
+        One section per kind of problem, with locations as path:line
+    """
+    try:
+        graph = await run_blocking("overleaf", "overleaf_unresolved", latex_graph.get_graph, project)
+        problems = graph.unresolved()
+        sections = []
+        for title, field in (("Undefined references", "refs"), ("Undefined citations", "cites"),
+                             ("Duplicate labels", "duplicate_labels"), ("Duplicate bib entries", "duplicate_entries")):
+            if problems[field]:
+                sections.append(f"{title}:\n" + "\n".join(
+                    f"  {key}: {_format_locations(locations)}" for key, locations in problems[field].items()
+                ))
+        if problems["missing_files"]:
+            sections.append("Missing files:\n" + "\n".join(
+                f"  {what}: {path}:{line}" for what, path, line in problems["missing_files"]
+            ))
+        return "\n\n".join(sections) or f"No unresolved references in project '{project}'"
+    except Exception as e:
+        return f"Error checking references: {str(e)}"
+
+
+@mcp.tool()
+async def overleaf_write_file(project: str, path: str, content: str) -> str:
     """
     Write or update a file in an Overleaf project.
 
@@ -120,28 +321,121 @@ def overleaf_write_file(project: str, path: str, content: str) -> str:
         Confirmation message
     """
     try:
-        return overleaf_utils.write_file(project, path, content)
+        return await run_blocking("overleaf", "overleaf_write_file", overleaf_utils.write_file, project, path, content)
     except Exception as e:
         return f"Error writing file: {str(e)}"
 
 
 @mcp.tool()
-def overleaf_push(project: str, message: str) -> str:
+async def overleaf_push(project: str, message: str, background: bool = False) -> str:
     """
     Commit and push changes to Overleaf.
 
+    Local commits from an earlier failed push are pushed too, so after
+    resolving a failed background push, call this again to deliver them.
+
     Args:
         project: The project name (as configured)
         message: Commit message describing the changes
+        background: Commit now but push later in the background, together with
+            any other commits made within a few seconds (default: False). Use
+            this while iterating on edits; check overleaf_push_status for the result.
 
     Returns:
         Status message with push result
     """
     try:
-        return overleaf_utils.commit_and_push(project, message)
+        if background:
+            return await run_blocking("overleaf", "overleaf_push", push_queue.commit_and_queue, project, message)
+        return await run_blocking("overleaf", "overleaf_push", overleaf_utils.commit_and_push, project, message)
     except Exception as e:
         return f"Error pushing changes: {str(e)}"
 
 
+@mcp.tool()
+async def overleaf_push_status(project: Optional[str] = None) -> str:
+    """
+    Show the state of background pushes (see overleaf_push with background=True).
+
+    Args:
+        project: Optional project name; all projects with queued pushes if omitted
+
+    Returns:
+        Per project: state, commits waiting to be pushed, retry attempts,
+        last push time and latency, and the last error
+    """
+    try:
+        statuses = push_queue.status(project)
+        if not statuses:
+            return "No background pushes" + (f" for project '{project}'" if project else "")
+        blocks = []
+        for s in statuses:
+            lines = [f"{s['project']}: {s['state']}, {s['pending_commits']} commit(s) waiting"]
+            if s["pending_commits"]:
+                lines.append(f"  queued {s['seconds_since_queued']:.0f}s ago, attempts: {s['attempts']}")
+            if s["last_push_at"] is not None:
+                when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(s["last_push_at"]))
+                lines.append(f"  last push: {when}, {s['last_push_seconds']:.1f}s, "
+                             f"{s['last_pushed_commits']} commit(s)")
+            if s["last_error"]:
+                lines.append(f"  last error: {s['last_error']}")
+            blocks.append("\n".join(lines))
+        return "\n".join(blocks)
+    except Exception as e:
+        return f"Error reading push status: {str(e)}"
+
+
+@mcp.tool()
+async def overleaf_apply_edits(project: str, edits: list[dict], message: str) -> str:
+    """
+    Apply several file edits as one commit and push it to Overleaf.
+
+    Prefer this over overleaf_write_file + overleaf_push when changing more than
+    one file, or when only part of a file changes. Only the touched files are
+    committed. If the push fails, the commit is undone and the files are
+    restored.
+
+    Args:
+        project: The project name (as configured)
+        edits: List of edits, applied in order. Each has a "path" plus one of:
+            {"content": "..."} to replace or create the whole file,
+            {"old": "...", "new": "..."} to replace text occurring exactly once,
+            {"start_line": 10, "end_line": 12, "content": "..."} to replace
+            lines 10-12 (1-based, inclusive; end_line = start_line - 1 inserts),
+            {"delete": true} to remove the file
+        message: Commit message describing the changes
+
+    Returns:
+        Status message with push result
+    """
+    try:
+        return await run_blocking("overleaf", "overleaf_apply_edits", overleaf_utils.apply_edits, project, edits, message)
+    except Exception as e:
+        return f"Error applying edits: {str(e)}"
+
+
+@mcp.tool()
+async def overleaf_stats(reset: bool = False) -> str:
+    """
+    Show latency and call-count statistics for this server.
+
+    Covers each tool call and every git subprocess (clone, pull, add, commit, push, ...).
+
+    Args:
+        reset: Clear the recorded statistics after reporting them (default: False)
+
+    Returns:
+        Summary table of counts, average/p95/max latency and output bytes
+    """
+    try:
+        report = metrics.render_text()
+        metrics.write_prometheus()
+        if reset:
+            metrics.reset()
+        return report
+    except Exception as e:
+        return f"Error reading stats: {str(e)}"
+
+
 if __name__ == "__main__":
     mcp.run()
@@ -0,0 +1,155 @@
+"""
+In-memory inverted index for searching Overleaf project files.
+
+Each project gets a ProjectIndex mapping lowercase words to the files and
+line numbers they occur on. Files are taken from the project's git manifest
+(so ignored and binary content is never read) and reindexed one at a time
+when their mtime or size changes, which keeps a search after a small edit
+cheap even on projects with hundreds of files.
+
+A query matches lines that contain it as a substring; the index narrows the
+candidates to lines containing every word of the query first, so queries
+must consist of whole words ("sec:intro" finds "\\label{sec:intro}", "intr"
+does not).
+"""
+
+import fnmatch
+import re
+import threading
+from pathlib import Path
+
+import overleaf_utils
+
+# Files worth indexing; everything else in a project is figures, data or build output
+TEXT_EXTENSIONS = {".tex", ".bib", ".sty", ".cls", ".bst", ".bbx", ".cbx", ".txt", ".md", ".cfg", ".def"}
+# Larger files are skipped (generated bibliographies, data dumps)
+MAX_FILE_BYTES = 2 * 1024 * 1024
+
+_WORD = re.compile(r"\w+")
+
+
+class _IndexedFile:
+    __slots__ = ("stamp", "lines", "words")
+
+    def __init__(self, stamp, lines, words):
+        self.stamp = stamp
+        self.lines = lines
+        self.words = words  # {word: [line numbers, ascending]}
+
+
+class ProjectIndex:
+    def __init__(self, project_path: Path):
+        self.project_path = project_path
+        self._files = {}
+        self._postings = {}  # {word: set of paths}
+        self._lock = threading.Lock()
+
+    def _drop(self, path):
+        indexed = self._files.pop(path, None)
+        if indexed is None:
+            return
+        for word in indexed.words:
+            paths = self._postings.get(word)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self._postings[word]
+
+    def _add(self, path, stamp):
+        try:
+            text = (self.project_path / path).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return
+        lines = text.splitlines()
+        words = {}
+        for number, line in enumerate(lines, 1):
+            for word in set(_WORD.findall(line.lower())):
+                words.setdefault(word, []).append(number)
+        self._files[path] = _IndexedFile(stamp, lines, words)
+        for word in words:
+            self._postings.setdefault(word, set()).add(path)
+
+    def refresh(self, manifest: dict) -> None:
+        """Bring the index in line with the manifest, rereading only changed files."""
+        wanted = {}
+        for path, (size, _) in manifest.items():
+            if Path(path).suffix.lower() in TEXT_EXTENSIONS and size <= MAX_FILE_BYTES:
+                wanted[path] = overleaf_utils.file_stamp(self.project_path / path)
+        with self._lock:
+            for path in [p for p in self._files if p not in wanted]:
+                self._drop(path)
+            for path, stamp in wanted.items():
+                indexed = self._files.get(path)
+                if indexed is not None and indexed.stamp == stamp:
+                    continue
+                self._drop(path)
+                if stamp is not None:
+                    self._add(path, stamp)
+
+    def search(self, query: str, max_results: int = 50, case_sensitive: bool = False,
+               pattern: str = None) -> list[dict]:
+        """Return up to max_results {"path", "line", "text"} matches, by path then line."""
+        words = set(_WORD.findall(query.lower()))
+        needle = query if case_sensitive else query.lower()
+        results = []
+        with self._lock:
+            if words:
+                candidates = set.intersection(*(self._postings.get(w, set()) for w in words))
+            else:
+                candidates = set(self._files)  # punctuation-only query: scan
+            for path in sorted(candidates):
+                if pattern and not fnmatch.fnmatch(path, pattern):
+                    continue
+                indexed = self._files[path]
+                if words:
+                    numbers = sorted(set.intersection(*(set(indexed.words[w]) for w in words)))
+                else:
+                    numbers = range(1, len(indexed.lines) + 1)
+                for number in numbers:
+                    line = indexed.lines[number - 1]
+                    if needle in (line if case_sensitive else line.lower()):
+                        results.append({"path": path, "line": number, "text": line})
+                        if len(results) >= max_results:
+                            return results
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "lines": sum(len(f.lines) for f in self._files.values()),
+                "words": len(self._postings),
+            }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(project_path: Path) -> ProjectIndex:
+    with _indexes_lock:
+        index = _indexes.get(project_path)
+        if index is None:
+            index = _indexes[project_path] = ProjectIndex(project_path)
+        return index
+
+
+def search(project_name: str, query: str, max_results: int = 50, case_sensitive: bool = False,
+           pattern: str = None) -> list[dict]:
+    """
+    Search a project's text files for lines containing query.
+
+    Args:
+        query: Text to find; its words must appear whole (e.g. "\\cite{smith2020")
+        max_results: Maximum number of matching lines to return
+        case_sensitive: Match case exactly (default: False)
+        pattern: Optional glob restricting which files are searched (e.g. "chapters/*")
+    """
+    if not query.strip():
+        raise ValueError("Empty search query")
+    project_path = overleaf_utils.get_project_path(project_name)
+    if not (project_path / ".git").exists():
+        raise ValueError(f"Project '{project_name}' not cloned. Run pull first.")
+    index = get_index(project_path)
+    index.refresh(overleaf_utils.project_manifest(project_path))
+    return index.search(query, max_results, case_sensitive, pattern)
@@ -3,29 +3,121 @@ Overleaf Git utilities for cloning, pulling, and pushing Overleaf projects.
 """
 
 import os
+import copy
+import contextvars
+import fnmatch
+import hashlib
+import itertools
 import json
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import quote
 
+import metrics
+
 _SCRIPT_DIR = Path(__file__).parent.absolute()
 CONFIG_PATH = _SCRIPT_DIR / "memory" / "overleaf_config.json"
 OVERLEAF_DIR = _SCRIPT_DIR / "overleaf"
 
+# Clone defaults; a project entry may override them with "clone_depth" and
+# "clone_filter". A blob-less partial clone keeps full history but downloads
+# file contents only when checked out; a depth truncates history as well.
+CLONE_DEPTH = None
+CLONE_FILTER = "blob:none"
+# Projects fetched at the same time by sync_all_projects
+SYNC_WORKERS = 4
+
+# Parsed config and resolved project paths, reused until the file's mtime or
+# size changes (or CONFIG_PATH points elsewhere)
+_config_lock = threading.Lock()
+_config_cache = {"stamp": None, "config": None, "paths": {}}
+
+# File manifests per project path: {"state": ..., "files": {path: (size, blob)}}.
+# Rebuilt from the git index when HEAD, the index or the refs change, and
+# patched in place by local writes.
+_manifest_lock = threading.Lock()
+_manifests = {}
+
+# Serializes git operations that commit, per project path
+_project_locks = {}
+_project_locks_guard = threading.Lock()
+
+# Paths written through write_file since the last commit, per project path,
+# and the (stamp, sha1) of what was written so identical rewrites can be
+# skipped without reading the file back. Projects are only trusted to have no
+# other changes after one full-tree commit in this process (_scanned), which
+# picks up anything written before a restart or outside the tools.
+_dirty_lock = threading.Lock()
+_dirty = {}
+_written = {}
+_scanned = set()
+
+
+def _run_git(args: list[str], cwd=None) -> subprocess.CompletedProcess:
+    """Run a git subcommand, capturing output and recording its latency."""
+    with metrics.timed("git", args[0]) as info:
+        result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True)
+        info["bytes"] = len(result.stdout) + len(result.stderr)
+    return result
+
+
+def _config_stamp():
+    try:
+        st = CONFIG_PATH.stat()
+    except FileNotFoundError:
+        return (str(CONFIG_PATH), None, None)
+    return (str(CONFIG_PATH), st.st_mtime_ns, st.st_size)
+
+
+def _cache_config(config: dict, stamp) -> None:
+    """Store config and its resolved project paths; call with _config_lock held."""
+    _config_cache["stamp"] = stamp
+    _config_cache["config"] = config
+    _config_cache["paths"] = {
+        name: _SCRIPT_DIR / project["local_path"]
+        for name, project in config.get("projects", {}).items()
+    }
+
+
+def _cached_config() -> tuple[dict, dict]:
+    """
+    Return (config, project paths), re-reading the file only if it changed.
+    Both are shared: do not mutate them.
+    """
+    stamp = _config_stamp()
+    with _config_lock:
+        if _config_cache["config"] is None or _config_cache["stamp"] != stamp:
+            if stamp[1] is None:
+                config = {"credentials": {}, "projects": {}}
+            else:
+                with open(CONFIG_PATH, "r") as f:
+                    config = json.load(f)
+            _cache_config(config, stamp)
+        return _config_cache["config"], _config_cache["paths"]
+
+
+def project_configs() -> dict:
+    """The configured projects by name, from the cached config. Shared: do not mutate."""
+    return _cached_config()[0].get("projects", {})
+
 
 def load_config() -> dict:
     """Load Overleaf configuration from JSON file."""
-    if not CONFIG_PATH.exists():
-        return {"credentials": {}, "projects": {}}
-    with open(CONFIG_PATH, "r") as f:
-        return json.load(f)
+    return copy.deepcopy(_cached_config()[0])
 
 
 def save_config(config: dict) -> None:
     """Save Overleaf configuration to JSON file."""
     CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with open(CONFIG_PATH, "w") as f:
+    tmp = CONFIG_PATH.with_name(CONFIG_PATH.name + ".tmp")
+    with open(tmp, "w") as f:
         json.dump(config, f, indent=2)
+    os.replace(tmp, CONFIG_PATH)
+    with _config_lock:
+        _cache_config(copy.deepcopy(config), _config_stamp())
 
 
 def get_git_url(project_id: str, config: dict) -> str:
@@ -51,131 +143,552 @@ def add_project(name: str, project_id: str) -> str:
 
 def get_project_path(project_name: str) -> Path:
     """Get the local path for a project."""
-    config = load_config()
-    project = config.get("projects", {}).get(project_name)
-    if not project:
+    path = _cached_config()[1].get(project_name)
+    if path is None:
         raise ValueError(f"Project '{project_name}' not found in config")
-    return _SCRIPT_DIR / project["local_path"]
+    return path
 
 
-def clone_or_pull(project_name: str) -> str:
-    """Clone the project if it doesn't exist locally, otherwise pull latest changes."""
-    config = load_config()
+def clone_or_pull(project_name: str, depth: int = None) -> str:
+    """
+    Clone the project if it doesn't exist locally, otherwise pull latest changes.
+
+    New clones are shallow to `depth` commits if given (else the project's
+    "clone_depth" or CLONE_DEPTH) and blob-filtered per "clone_filter" or
+    CLONE_FILTER; an empty filter clones everything.
+    """
+    config, paths = _cached_config()
     project = config.get("projects", {}).get(project_name)
     if not project:
         return f"Error: Project '{project_name}' not found in config"
 
-    project_path = _SCRIPT_DIR / project["local_path"]
+    project_path = paths[project_name]
     git_url = get_git_url(project["project_id"], config)
 
-    if project_path.exists() and (project_path / ".git").exists():
-        # Pull latest changes
-        result = subprocess.run(
-            ["git", "pull"],
-            cwd=project_path,
-            capture_output=True,
-            text=True
-        )
-        if result.returncode != 0:
-            return f"Error pulling: {result.stderr}"
-        return f"Pulled latest changes for '{project_name}'\n{result.stdout}"
-    else:
-        # Clone the project
-        project_path.parent.mkdir(parents=True, exist_ok=True)
-        result = subprocess.run(
-            ["git", "clone", git_url, str(project_path)],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode != 0:
-            return f"Error cloning: {result.stderr}"
-        return f"Cloned '{project_name}' to {project_path}"
-
-
-def list_files(project_name: str) -> list[str]:
-    """List all files in a project (excluding .git directory)."""
+    # Serialized with background fetches and pushes; checked under the lock so
+    # two callers never clone into the same path
+    with _project_lock(project_path):
+        if project_path.exists() and (project_path / ".git").exists():
+            # Pull latest changes
+            result = _run_git(["pull"], cwd=project_path)
+            if result.returncode != 0:
+                return f"Error pulling: {result.stderr}"
+            return f"Pulled latest changes for '{project_name}'\n{result.stdout}"
+        else:
+            # Clone the project
+            project_path.parent.mkdir(parents=True, exist_ok=True)
+            args = ["clone"]
+            depth = depth or project.get("clone_depth", CLONE_DEPTH)
+            if depth:
+                args += ["--depth", str(depth)]
+            clone_filter = project.get("clone_filter", CLONE_FILTER)
+            if clone_filter:
+                args.append(f"--filter={clone_filter}")
+            result = _run_git([*args, git_url, str(project_path)])
+            if result.returncode != 0:
+                return f"Error cloning: {result.stderr}"
+            return f"Cloned '{project_name}' to {project_path}"
+
+
+def file_stamp(path: Path):
+    """(mtime_ns, size) of path, or None if it does not exist; cheap change detection for caches."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _repo_state(project_path: Path):
+    """Cheap fingerprint of HEAD, the current branch ref and the index, from a few stats."""
+    git_dir = project_path / ".git"
+    head = (git_dir / "HEAD").read_text().strip()
+    paths = [git_dir / "index", git_dir / "packed-refs"]
+    if head.startswith("ref: "):
+        paths.append(git_dir / head[5:])
+    return (head, *(file_stamp(p) for p in paths))
+
+
+def _build_manifest(project_path: Path) -> dict:
+    """Map each tracked or untracked (non-ignored) file to (size, blob id or None)."""
+    tracked = _run_git(["ls-files", "-s", "-z"], cwd=project_path)
+    if tracked.returncode != 0:
+        raise RuntimeError(f"git ls-files failed: {tracked.stderr}")
+    untracked = _run_git(["ls-files", "--others", "--exclude-standard", "-z"], cwd=project_path)
+    if untracked.returncode != 0:
+        raise RuntimeError(f"git ls-files failed: {untracked.stderr}")
+
+    entries = {}
+    for record in tracked.stdout.split("\0"):
+        if record:
+            meta, path = record.split("\t", 1)
+            entries[path] = meta.split(" ")[1]
+    entries.update((path, None) for path in untracked.stdout.split("\0") if path)
+
+    files = {}
+    for path, blob in entries.items():
+        stamp = file_stamp(project_path / path)
+        if stamp is not None:  # tracked but deleted in the working tree
+            files[path] = (stamp[1], blob)
+    return files
+
+
+def project_manifest(project_path: Path, refresh: bool = False) -> dict:
+    """
+    Return the project's {path: (size, blob)} manifest, rebuilding it only when stale.
+    The dict is a shared snapshot that is never changed afterwards: do not mutate it.
+    """
+    state = _repo_state(project_path)
+    with _manifest_lock:
+        cached = _manifests.get(project_path)
+        if cached is not None and cached["state"] == state and not refresh:
+            return cached["files"]
+    files = _build_manifest(project_path)
+    with _manifest_lock:
+        _manifests[project_path] = {"state": state, "files": files}
+    return files
+
+
+def _manifest_update(project_path: Path, file_path: str, size) -> None:
+    """
+    Record a local write (or, with size None, a deletion) in the cached
+    manifest; a written file's blob is no longer the staged one.
+    """
+    with _manifest_lock:
+        cached = _manifests.get(project_path)
+        if cached is not None:
+            # Copy on write: callers may be iterating the previous snapshot without the lock
+            files = dict(cached["files"])
+            if size is None:
+                files.pop(Path(file_path).as_posix(), None)
+            else:
+                files[Path(file_path).as_posix()] = (size, None)
+            cached["files"] = files
+
+
+def _project_lock(project_path: Path) -> threading.Lock:
+    with _project_locks_guard:
+        return _project_locks.setdefault(project_path, threading.Lock())
+
+
+def list_files(
+    project_name: str,
+    pattern: str = None,
+    extensions: list[str] = None,
+    min_size: int = None,
+    max_size: int = None,
+    refresh: bool = False,
+) -> list[str]:
+    """
+    List the files in a project: everything git tracks plus untracked files
+    that are not ignored.
+
+    The listing comes from a cached manifest, so it does not walk the working
+    tree. Files created outside these tools appear after the next pull or
+    commit, or with refresh=True.
+
+    Args:
+        pattern: Glob matched against the relative path (e.g. "chapters/*.tex")
+        extensions: Keep only these extensions (e.g. ["tex", ".bib"])
+        min_size, max_size: Size bounds in bytes
+        refresh: Rebuild the manifest even if git state is unchanged
+    """
     project_path = get_project_path(project_name)
-    if not project_path.exists():
+    if not (project_path / ".git").exists():
         raise ValueError(f"Project '{project_name}' not cloned. Run pull first.")
 
+    suffixes = tuple("." + ext.lstrip(".").lower() for ext in extensions) if extensions else None
     files = []
-    for path in project_path.rglob("*"):
-        if path.is_file() and ".git" not in path.parts:
-            files.append(str(path.relative_to(project_path)))
+    for path, (size, _) in project_manifest(project_path, refresh).items():
+        if pattern and not fnmatch.fnmatch(path, pattern):
+            continue
+        if suffixes and not path.lower().endswith(suffixes):
+            continue
+        if (min_size is not None and size < min_size) or (max_size is not None and size > max_size):
+            continue
+        files.append(path)
     return sorted(files)
 
 
-def read_file(project_name: str, file_path: str) -> str:
-    """Read a file's content from a project."""
+def read_file(project_name: str, file_path: str, start_line: int = None, end_line: int = None) -> str:
+    """
+    Read a file's content from a project.
+
+    With start_line and/or end_line (1-based, inclusive), only that range of
+    lines is returned, and the file is read no further than end_line.
+    """
     project_path = get_project_path(project_name)
     full_path = project_path / file_path
 
     if not full_path.exists():
         raise FileNotFoundError(f"File '{file_path}' not found in project '{project_name}'")
 
-    return full_path.read_text(encoding="utf-8")
+    if start_line is None and end_line is None:
+        return full_path.read_text(encoding="utf-8")
+    start = max(1, start_line or 1)
+    if end_line is not None and end_line < start:
+        raise ValueError(f"Invalid line range {start}-{end_line}")
+    with open(full_path, "r", encoding="utf-8") as f:
+        return "".join(itertools.islice(f, start - 1, end_line))
+
+
+def _same_content(project_path: Path, rel: str, full_path: Path, data: bytes, digest: bytes) -> bool:
+    stamp = file_stamp(full_path)
+    if stamp is None or stamp[1] != len(data):
+        return False
+    with _dirty_lock:
+        known = _written.get(project_path, {}).get(rel)
+    if known is not None and known[0] == stamp:
+        return known[1] == digest
+    return hashlib.sha1(full_path.read_bytes()).digest() == digest
 
 
 def write_file(project_name: str, file_path: str, content: str) -> str:
-    """Write content to a file in a project."""
+    """Write content to a file in a project, unless it already holds exactly that content."""
     project_path = get_project_path(project_name)
     full_path = project_path / file_path
+    rel = Path(file_path).as_posix()
+
+    # Same bytes write_text would produce, so the comparison matches what lands on disk
+    data = (content.replace("\n", os.linesep) if os.linesep != "\n" else content).encode("utf-8")
+    digest = hashlib.sha1(data).digest()
+    if _same_content(project_path, rel, full_path, data, digest):
+        return f"Unchanged: {file_path} already has this content"
 
     # Create parent directories if needed
     full_path.parent.mkdir(parents=True, exist_ok=True)
-    full_path.write_text(content, encoding="utf-8")
+    full_path.write_bytes(data)
+    _manifest_update(project_path, file_path, len(data))
+    with _dirty_lock:
+        _dirty.setdefault(project_path, set()).add(rel)
+        _written.setdefault(project_path, {})[rel] = (file_stamp(full_path), digest)
 
     return f"Written {len(content)} characters to {file_path}"
 
 
+def _clear_dirty(project_path: Path, paths) -> None:
+    with _dirty_lock:
+        dirty = _dirty.get(project_path)
+        if dirty:
+            dirty.difference_update(paths)
+
+
 def commit_and_push(project_name: str, message: str) -> str:
-    """Stage all changes, commit, and push to Overleaf."""
+    """
+    Commit and push to Overleaf the files written through write_file.
+
+    The first commit of a project in this process stages the whole working
+    tree, as changes may predate it; after that only the written paths are
+    staged, and with none there is nothing to run. Local commits left over
+    from an earlier failed push are pushed even when nothing new was written.
+    """
     project_path = get_project_path(project_name)
 
     if not project_path.exists():
         return f"Error: Project '{project_name}' not cloned"
 
-    # Stage all changes
-    result = subprocess.run(
-        ["git", "add", "-A"],
-        cwd=project_path,
-        capture_output=True,
-        text=True
-    )
-    if result.returncode != 0:
-        return f"Error staging changes: {result.stderr}"
-
-    # Check if there are changes to commit
-    status = subprocess.run(
-        ["git", "status", "--porcelain"],
-        cwd=project_path,
-        capture_output=True,
-        text=True
-    )
-    if not status.stdout.strip():
-        return "No changes to commit"
+    with _project_lock(project_path):
+        error = _commit(project_path, message)
+        if error == "No changes to commit":
+            unpushed = _unpushed(project_path)
+            if not unpushed:
+                return error
+            message = f"{unpushed} earlier local commit(s)"
+        elif error:
+            return error
+        # Push
+        result = _run_git(["push"], cwd=project_path)
+        if result.returncode != 0:
+            return f"Error pushing: {result.stderr}"
+
+    return f"Changes pushed to Overleaf: {message}"
+
+
+def commit_changes(project_name: str, message: str) -> str:
+    """Commit like commit_and_push, without pushing. Returns None on success, else a message."""
+    project_path = get_project_path(project_name)
+
+    if not project_path.exists():
+        return f"Error: Project '{project_name}' not cloned"
+
+    with _project_lock(project_path):
+        return _commit(project_path, message)
+
+
+def _unpushed(project_path: Path) -> int:
+    """Number of local commits not on the upstream branch (0 without one); call with the project lock held."""
+    result = _run_git(["rev-list", "--count", "@{u}..HEAD"], cwd=project_path)
+    return int(result.stdout.strip() or 0) if result.returncode == 0 else 0
+
+
+def unpushed_commits(project_name: str) -> int:
+    """Number of local commits that have not reached Overleaf yet."""
+    project_path = get_project_path(project_name)
+    with _project_lock(project_path):
+        return _unpushed(project_path)
+
+
+def push(project_name: str) -> subprocess.CompletedProcess:
+    """Push the project's local commits, serialized with other git work on it."""
+    project_path = get_project_path(project_name)
+    with _project_lock(project_path):
+        return _run_git(["push"], cwd=project_path)
+
+
+def pull_rebase(project_name: str) -> subprocess.CompletedProcess:
+    """
+    Replay local commits on top of the remote, e.g. after a rejected push.
+
+    Uncommitted edits are stashed around the rebase. A rebase that stops on
+    conflicts is aborted, so the checkout is left as it was rather than
+    mid-rebase; the failed result is still returned.
+    """
+    project_path = get_project_path(project_name)
+    with _project_lock(project_path):
+        result = _run_git(["pull", "--rebase", "--autostash"], cwd=project_path)
+        in_rebase = any((project_path / ".git" / d).exists() for d in ("rebase-merge", "rebase-apply"))
+        if result.returncode != 0 and in_rebase:
+            _run_git(["rebase", "--abort"], cwd=project_path)
+        return result
+
+
+def _commit(project_path: Path, message: str):
+    with _dirty_lock:
+        paths = sorted(_dirty.get(project_path, ()))
+        full_scan = project_path not in _scanned
+
+    if full_scan:
+        # Stage all changes
+        result = _run_git(["add", "-A"], cwd=project_path)
+        if result.returncode != 0:
+            return f"Error staging changes: {result.stderr}"
+
+        # Check if there are changes to commit
+        status = _run_git(["status", "--porcelain"], cwd=project_path)
+        if not status.stdout.strip():
+            with _dirty_lock:
+                _scanned.add(project_path)
+            _clear_dirty(project_path, paths)
+            return "No changes to commit"
+        commit_args = ["commit", "-m", message]
+    else:
+        if not paths:
+            return "No changes to commit"
+        # Stage only what was written
+        result = _run_git(["add", "-A", "--", *paths], cwd=project_path)
+        if result.returncode != 0:
+            return f"Error staging changes: {result.stderr}"
+        commit_args = ["commit", "-m", message, "--only", "--", *paths]
 
     # Commit
-    result = subprocess.run(
-        ["git", "commit", "-m", message],
-        cwd=project_path,
-        capture_output=True,
-        text=True
-    )
+    result = _run_git(commit_args, cwd=project_path)
     if result.returncode != 0:
+        if any(s in result.stdout for s in ("nothing to commit", "nothing added to commit", "no changes added")):
+            # Written back to their committed content
+            _clear_dirty(project_path, paths)
+            return "No changes to commit"
         return f"Error committing: {result.stderr}"
+    with _dirty_lock:
+        _scanned.add(project_path)
+    _clear_dirty(project_path, paths)
+    return None
+
+
+def sync_all_projects(max_workers: int = SYNC_WORKERS) -> list[dict]:
+    """
+    Clone or pull every configured project, up to max_workers at a time.
+
+    Returns one dict per project, in config order, with "project", "ok",
+    "seconds" and the clone_or_pull "message".
+    """
+    names = list(project_configs())
+
+    def sync(name):
+        start = time.perf_counter()
+        try:
+            message = clone_or_pull(name)
+            ok = not message.startswith("Error")
+        except Exception as e:
+            message, ok = f"Error: {e}", False
+        return {"project": name, "ok": ok, "seconds": time.perf_counter() - start, "message": message}
+
+    if not names:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(names)))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, sync, name) for name in names]
+        return [f.result() for f in futures]
+
+
+def _resolve_in_project(project_path: Path, file_path: str) -> Path:
+    full_path = (project_path / file_path).resolve()
+    if full_path == project_path.resolve() or not full_path.is_relative_to(project_path.resolve()):
+        raise ValueError(f"Path '{file_path}' is outside the project")
+    if ".git" in full_path.relative_to(project_path.resolve()).parts:
+        raise ValueError(f"Path '{file_path}' is inside .git")
+    return full_path
+
+
+def _apply_edit(text, edit: dict):
+    """Return the new content (None to delete) after applying one edit to text (None if absent)."""
+    path = edit["path"]
+    if edit.get("delete"):
+        if text is None:
+            raise ValueError(f"Cannot delete '{path}': file does not exist")
+        return None
+    if "old" in edit:
+        if text is None:
+            raise ValueError(f"Cannot patch '{path}': file does not exist")
+        count = text.count(edit["old"])
+        if count != 1:
+            raise ValueError(f"Patch for '{path}' must match exactly once, matched {count} times")
+        return text.replace(edit["old"], edit.get("new", ""))
+    if "start_line" in edit:
+        if text is None:
+            raise ValueError(f"Cannot edit lines of '{path}': file does not exist")
+        lines = text.splitlines(keepends=True)
+        start = int(edit["start_line"])
+        end = int(edit.get("end_line", start))
+        if not 1 <= start <= len(lines) + 1 or not start - 1 <= end <= len(lines):
+            raise ValueError(f"Line range {start}-{end} is outside '{path}' ({len(lines)} lines)")
+        content = edit.get("content", "")
+        # Keep the replaced lines' newline unless the range ends a file that had none
+        newline = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+        at_eof_without_newline = end == len(lines) and lines and not lines[-1].endswith("\n")
+        if content and not content.endswith("\n") and not at_eof_without_newline:
+            content += newline
+        return "".join(lines[:start - 1]) + content + "".join(lines[end:])
+    if "content" in edit:
+        return edit["content"]
+    raise ValueError(f"Edit for '{path}' needs one of content, old/new, start_line or delete")
+
+
+def apply_edits(project_name: str, edits: list[dict], message: str) -> str:
+    """
+    Apply a set of file edits as one commit and push it to Overleaf.
+
+    Each edit names a "path" and one of:
+        {"content": ...}                                replace or create the file
+        {"old": ..., "new": ...}                        replace text that occurs exactly once
+        {"start_line": a, "end_line": b, "content": ...}  replace lines a..b (1-based,
+                                                         inclusive; b = a - 1 inserts before a)
+        {"delete": true}                                remove the file
+    Edits run in order, so several may target the same file. All of them are
+    validated before anything is written. Only the touched paths are staged
+    and committed; if the commit or push fails, the commit is undone and the
+    files and index entries are restored to their previous state.
+    """
+    project_path = get_project_path(project_name)
+    if not (project_path / ".git").exists():
+        return f"Error: Project '{project_name}' not cloned"
+    if not edits:
+        return "No edits given"
+
+    with _project_lock(project_path):
+        # Work out every new file content before touching the disk
+        originals = {}
+        updated = {}
+        for edit in edits:
+            if "path" not in edit:
+                return "Error: every edit needs a path"
+            try:
+                full_path = _resolve_in_project(project_path, edit["path"])
+                rel = full_path.relative_to(project_path.resolve()).as_posix()
+                if rel not in originals:
+                    originals[rel] = full_path.read_bytes() if full_path.is_file() else None
+                    updated[rel] = originals[rel].decode("utf-8") if originals[rel] is not None else None
+                updated[rel] = _apply_edit(updated[rel], edit)
+            except (ValueError, UnicodeDecodeError) as e:
+                return f"Error: {e}. Nothing was changed."
+
+        changed = [rel for rel in updated
+                   if (updated[rel].encode("utf-8") if updated[rel] is not None else None) != originals[rel]]
+        if not changed:
+            return "No changes to commit"
+
+        def restore_files(paths):
+            for rel in paths:
+                full_path = project_path / rel
+                if originals[rel] is None:
+                    if full_path.is_file():
+                        full_path.unlink()
+                    _manifest_update(project_path, rel, None)
+                else:
+                    full_path.parent.mkdir(parents=True, exist_ok=True)
+                    full_path.write_bytes(originals[rel])
+                    _manifest_update(project_path, rel, len(originals[rel]))
+
+        written = []
+        try:
+            for rel in changed:
+                full_path = project_path / rel
+                written.append(rel)
+                if updated[rel] is None:
+                    full_path.unlink()
+                    _manifest_update(project_path, rel, None)
+                else:
+                    full_path.parent.mkdir(parents=True, exist_ok=True)
+                    data = updated[rel].encode("utf-8")
+                    full_path.write_bytes(data)
+                    _manifest_update(project_path, rel, len(data))
+        except OSError as e:
+            restore_files(written)
+            return f"Error writing '{written[-1]}', changes rolled back: {e}"
+
+        result = _run_git(["add", "-A", "--", *changed], cwd=project_path)
+        if result.returncode == 0:
+            result = _run_git(["commit", "-q", "-m", message, "--only", "--", *changed], cwd=project_path)
+        if result.returncode != 0:
+            _run_git(["reset", "-q", "--", *changed], cwd=project_path)
+            restore_files(changed)
+            return f"Error committing, changes rolled back: {result.stderr}"
 
-    # Push
-    result = subprocess.run(
-        ["git", "push"],
-        cwd=project_path,
-        capture_output=True,
-        text=True
-    )
-    if result.returncode != 0:
-        return f"Error pushing: {result.stderr}"
+        result = _run_git(["push"], cwd=project_path)
+        if result.returncode != 0:
+            # Drop the local commit and put files and index entries back as they were
+            _run_git(["reset", "-q", "--soft", "HEAD~1"], cwd=project_path)
+            _run_git(["reset", "-q", "--", *changed], cwd=project_path)
+            restore_files(changed)
+            return f"Error pushing, changes rolled back: {result.stderr}"
+        _clear_dirty(project_path, changed)
 
-    return f"Changes pushed to Overleaf: {message}"
+    return f"Changes pushed to Overleaf ({len(changed)} files): {message}"
+
+
+def fetch_project(project_name: str) -> dict:
+    """
+    Fetch the project's remote and fast-forward the checkout if it is clean.
+
+    Clones projects that are not local yet. Returns {"updated": commits
+    fast-forwarded, "behind": commits the checkout still lacks, "stale":
+    whether it lacks any, "reason": why they could not be applied}.
+    """
+    project_path = get_project_path(project_name)
+    if not (project_path / ".git").exists():
+        message = clone_or_pull(project_name)
+        if message.startswith("Error"):
+            raise RuntimeError(message)
+        return {"updated": 0, "behind": 0, "stale": False, "reason": None}
+
+    with _project_lock(project_path):
+        result = _run_git(["fetch", "-q"], cwd=project_path)
+        if result.returncode != 0:
+            raise RuntimeError(f"git fetch failed: {result.stderr.strip()}")
+        result = _run_git(["rev-list", "--count", "HEAD..@{u}"], cwd=project_path)
+        if result.returncode != 0:
+            raise RuntimeError(f"git rev-list failed: {result.stderr.strip()}")
+        behind = int(result.stdout.strip() or 0)
+        if not behind:
+            return {"updated": 0, "behind": 0, "stale": False, "reason": None}
+
+        with _dirty_lock:
+            written = bool(_dirty.get(project_path))
+        status = _run_git(["status", "--porcelain", "--untracked-files=no"], cwd=project_path)
+        if written or status.stdout.strip():
+            return {"updated": 0, "behind": behind, "stale": True, "reason": "uncommitted local changes"}
+        result = _run_git(["merge", "--ff-only", "-q", "@{u}"], cwd=project_path)
+        if result.returncode != 0:
+            return {"updated": 0, "behind": behind, "stale": True, "reason": "local commits diverge from Overleaf"}
+    return {"updated": behind, "behind": 0, "stale": False, "reason": None}
 
 
 def list_projects() -> dict:
@@ -0,0 +1,198 @@
+"""
+Debounced background pushes for Overleaf projects.
+
+overleaf_push(..., background=True) commits locally right away and hands the
+push to this module. Each project gets a worker thread that waits until no
+new commit has been queued for the debounce window, then pushes everything
+in one `git push`, so a burst of edit/push cycles costs a single round trip
+to git.overleaf.com. Failed pushes are retried with exponential backoff; a
+rejected push is first rebased onto the remote, and if that rebase conflicts
+it is aborted and the queue gives up until the conflict is resolved. Pushes go through
+overleaf_utils.push, which holds the project's lock, so they never overlap
+other git work on the same checkout.
+"""
+
+import atexit
+import threading
+import time
+
+import overleaf_utils
+
+# Seconds without new commits before a queued push starts; a project entry in
+# the Overleaf config may override it with "push_debounce"
+PUSH_DEBOUNCE = 10.0
+# Retry policy for failed pushes
+MAX_PUSH_RETRIES = 5
+RETRY_BASE = 2.0
+RETRY_CAP = 120.0
+
+
+class _ProjectQueue:
+    def __init__(self, project_name: str):
+        self.project_name = project_name
+        self.cond = threading.Condition()
+        self.push_lock = threading.Lock()  # one push_now at a time (worker vs flush)
+        self.pending = []  # commit messages waiting to be pushed
+        self.last_queued = 0.0
+        self.state = "idle"
+        self.attempts = 0
+        self.last_push_at = None
+        self.last_push_seconds = None
+        self.last_pushed_commits = 0
+        self.last_error = None
+        self.thread = threading.Thread(target=self._run, name=f"overleaf-push-{project_name}", daemon=True)
+        self.thread.start()
+
+    def _debounce(self) -> float:
+        project = overleaf_utils.project_configs().get(self.project_name, {})
+        return float(project.get("push_debounce", PUSH_DEBOUNCE))
+
+    def add(self, message: str) -> None:
+        with self.cond:
+            self.pending.append(message)
+            self._wake()
+
+    def resume(self, unpushed: int) -> None:
+        """Queue a push for local commits left over from an earlier failure or process."""
+        with self.cond:
+            self.pending.extend(["earlier local commit"] * (unpushed - len(self.pending)))
+            self._wake()
+
+    def _wake(self):
+        # Call with cond held
+        self.last_queued = time.monotonic()
+        if self.state in ("idle", "failed"):
+            self.state = "waiting"
+            self.attempts = 0
+        self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                # After giving up, wait for the next commit before trying again
+                while not self.pending or self.state == "failed":
+                    self.cond.wait()
+                # Wait out the debounce window, restarting it on each new commit
+                while True:
+                    remaining = self.last_queued + self._debounce() - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            self.push_now()
+
+    def push_now(self, retry: bool = True) -> bool:
+        """Push the pending commits, retrying with backoff. Returns True once they are pushed."""
+        with self.push_lock:
+            return self._push(retry)
+
+    def _push(self, retry: bool) -> bool:
+        while True:
+            with self.cond:
+                if not self.pending:
+                    return True
+                batch = len(self.pending)
+                self.state = "pushing"
+                self.attempts += 1
+                attempt = self.attempts
+            start = time.perf_counter()
+            try:
+                result = overleaf_utils.push(self.project_name)
+                ok, error = result.returncode == 0, result.stderr.strip()
+            except Exception as e:
+                ok, error = False, str(e)
+            elapsed = time.perf_counter() - start
+
+            with self.cond:
+                if ok:
+                    del self.pending[:batch]
+                    self.last_push_at = time.time()
+                    self.last_push_seconds = elapsed
+                    self.last_pushed_commits = batch
+                    self.last_error = None
+                    self.attempts = 0
+                    self.state = "waiting" if self.pending else "idle"
+                    return not self.pending
+                self.last_error = error
+                if not retry or attempt > MAX_PUSH_RETRIES:
+                    # Keep the commits; the next queued push starts a fresh round of retries
+                    self.state = "failed"
+                    return False
+                self.state = "retrying"
+            if "rejected" in error or "fetch first" in error:
+                rebase = overleaf_utils.pull_rebase(self.project_name)
+                if rebase.returncode != 0:
+                    output = f"{rebase.stdout}\n{rebase.stderr}".splitlines()
+                    reasons = [line for line in output if line.startswith(("CONFLICT", "error", "fatal"))]
+                    if any(line.startswith("CONFLICT") for line in output):
+                        prefix = "rebase onto Overleaf hit a conflict (aborted; resolve it in the checkout, then push again): "
+                    else:
+                        prefix = "rebase onto Overleaf failed: "
+                    with self.cond:
+                        self.last_error = prefix + "; ".join(reasons or output[-1:])
+                        self.state = "failed"
+                    return False
+            time.sleep(min(RETRY_CAP, RETRY_BASE * 2 ** (attempt - 1)))
+
+    def status(self) -> dict:
+        with self.cond:
+            return {
+                "project": self.project_name,
+                "state": self.state,
+                "pending_commits": len(self.pending),
+                "seconds_since_queued": time.monotonic() - self.last_queued if self.pending else None,
+                "attempts": self.attempts,
+                "last_push_at": self.last_push_at,
+                "last_push_seconds": self.last_push_seconds,
+                "last_pushed_commits": self.last_pushed_commits,
+                "last_error": self.last_error,
+            }
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def _queue(project_name: str) -> _ProjectQueue:
+    with _queues_lock:
+        queue = _queues.get(project_name)
+        if queue is None:
+            queue = _queues[project_name] = _ProjectQueue(project_name)
+        return queue
+
+
+def commit_and_queue(project_name: str, message: str) -> str:
+    """
+    Commit the project's changes now and schedule a debounced background push.
+
+    With nothing new to commit, local commits that an earlier push failed to
+    deliver are queued instead.
+    """
+    error = overleaf_utils.commit_changes(project_name, message)
+    if error == "No changes to commit":
+        unpushed = overleaf_utils.unpushed_commits(project_name)
+        if unpushed:
+            _queue(project_name).resume(unpushed)
+            return f"No new changes; push queued for {unpushed} earlier local commit(s)"
+    if error:
+        return error
+    _queue(project_name).add(message)
+    return f"Committed locally; push queued: {message}"
+
+
+def status(project_name: str = None) -> list[dict]:
+    """Queue status for one project, or for every project that has used the queue."""
+    with _queues_lock:
+        queues = [_queues[project_name]] if project_name in _queues else (
+            [] if project_name else list(_queues.values()))
+    return [q.status() for q in queues]
+
+
+def flush() -> None:
+    """Push whatever is still queued, once each, without waiting for the debounce window."""
+    with _queues_lock:
+        queues = list(_queues.values())
+    for queue in queues:
+        queue.push_now(retry=False)
+
+
+atexit.register(flush)
@@ -0,0 +1,142 @@
+"""
+Quota-aware scheduling for Google API calls.
+
+Every request made through google_utils passes through execute(): it first
+takes its quota-unit cost from a per-API token bucket, so bulk runs proceed at
+the highest rate the per-user quota sustains instead of tripping it, and then
+retries rate-limit and server errors with exponential backoff and full jitter,
+honoring Retry-After when Google sends one.
+"""
+
+import random
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+import metrics
+
+# Per-user quota, as (units per second, burst capacity) for each API.
+# Gmail allows 250 units/user/second; Calendar is metered per minute, so it
+# gets a lower steady rate with some burst headroom.
+RATE_LIMITS = {
+    "gmail": (250.0, 250.0),
+    "calendar": (10.0, 50.0),
+}
+
+# Quota units per method (https://developers.google.com/gmail/api/reference/quota).
+# Methods not listed cost DEFAULT_COST.
+QUOTA_COSTS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.labels.list": 1,
+    "gmail.users.history.list": 2,
+    "gmail.users.messages.list": 5,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.modify": 5,
+    "gmail.users.messages.batchModify": 50,
+    "gmail.users.messages.send": 100,
+}
+DEFAULT_COST = 1
+
+# Retry policy
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 32.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+# Methods that are safe to repeat after a 5xx, when Google may already have
+# acted on the first attempt. Besides these, any *.get / *.list method is; all
+# other methods (messages.send, events.insert/update/delete, ...) are retried
+# only after a 429 or rate-limit 403, which Google returns before doing anything.
+IDEMPOTENT_METHODS = {
+    "gmail.users.getProfile",
+    "gmail.users.messages.modify",
+    "gmail.users.messages.batchModify",
+    "calendar.freebusy.query",
+    "gmail.batch",  # batches of messages.get
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket; callers reserve tokens and sleep off any deficit."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, units: float) -> float:
+        """Take units from the bucket, blocking until they are available. Returns seconds waited."""
+        units = min(units, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= units
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+_buckets = {api: TokenBucket(rate, capacity) for api, (rate, capacity) in RATE_LIMITS.items()}
+
+
+def cost(method_id: str) -> int:
+    return QUOTA_COSTS.get(method_id, DEFAULT_COST)
+
+
+def acquire(method_id: str, units=None) -> None:
+    """Wait for quota for one call to method_id (or an explicit number of units)."""
+    api = method_id.split(".", 1)[0]
+    bucket = _buckets.get(api)
+    if bucket is None:
+        return
+    waited = bucket.acquire(cost(method_id) if units is None else units)
+    if waited:
+        metrics.observe("quota", f"wait:{api}", waited)
+
+
+def is_idempotent(method_id: str) -> bool:
+    return method_id in IDEMPOTENT_METHODS or method_id.rsplit(".", 1)[-1] in ("get", "list")
+
+
+def is_retryable(error: Exception, method_id: str) -> bool:
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status == 429:
+        return True
+    if status in RETRY_STATUSES:
+        return is_idempotent(method_id)
+    if status == 403:
+        reasons = {d.get("reason") for d in (error.error_details or []) if isinstance(d, dict)}
+        return bool(reasons & RATE_LIMIT_REASONS)
+    return False
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retry number attempt (0-based): Retry-After if given, else jittered backoff."""
+    retry_after = error.resp.get("retry-after") if isinstance(error, HttpError) else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def execute(method_id: str, call, units=None):
+    """Run call() under the API's rate limit, retrying transient failures."""
+    for attempt in range(MAX_RETRIES + 1):
+        acquire(method_id, units)
+        try:
+            return call()
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_retryable(e, method_id):
+                raise
+            delay = retry_delay(e, attempt)
+            metrics.observe("quota", f"retry:{method_id}", delay)
+            time.sleep(delay)
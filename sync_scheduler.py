@@ -0,0 +1,121 @@
+"""
+Background fetching of Overleaf projects, so reads start from a fresh checkout.
+
+Once started by the Overleaf server, a scheduler thread fetches every
+configured project every SYNC_INTERVAL seconds (or its "sync_interval" from
+the Overleaf config; 0 turns it off for that project). A clean checkout is
+fast-forwarded; one with local changes or diverging commits is left alone and
+marked stale. The tools report that state next to listings and reads. Set
+OVERLEAF_AUTO_SYNC=0 to turn background fetching off.
+"""
+
+import contextvars
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import overleaf_utils
+
+ENABLED = os.getenv("OVERLEAF_AUTO_SYNC", "1").lower() not in ("0", "false", "no", "off")
+# Default seconds between background fetches of a project
+SYNC_INTERVAL = 300
+# Projects fetched at the same time
+SYNC_WORKERS = 2
+# Scheduler wake-up period, which bounds how late a fetch can start
+TICK = 5.0
+
+_lock = threading.Lock()
+_state = {}  # project -> {"synced_at", "behind", "stale", "reason", "error", "running"}
+_started = False
+
+
+def _interval(project: dict) -> float:
+    return float(project.get("sync_interval", SYNC_INTERVAL))
+
+
+def _sync(project_name: str) -> None:
+    metrics.current_tool.set("auto_sync")
+    try:
+        result = overleaf_utils.fetch_project(project_name)
+        update = dict(result, error=None, synced_at=time.time())
+    except Exception as e:
+        update = {"error": str(e)}
+    with _lock:
+        state = _state.setdefault(project_name, {})
+        state.update(update, running=False, attempted_at=time.time())
+
+
+def _due(now: float) -> list[str]:
+    projects = overleaf_utils.project_configs()
+    due = []
+    with _lock:
+        for name, project in projects.items():
+            interval = _interval(project)
+            if interval <= 0:
+                continue
+            state = _state.setdefault(name, {})
+            if state.get("running") or now - state.get("attempted_at", 0) < interval:
+                continue
+            state["running"] = True
+            due.append(name)
+    return due
+
+
+def _run(pool: ThreadPoolExecutor) -> None:
+    while True:
+        try:
+            for name in _due(time.time()):
+                pool.submit(contextvars.copy_context().run, _sync, name)
+        except Exception as e:
+            # A broken config must not kill the scheduler; try again next tick
+            print(f"Overleaf auto-sync error: {e}", file=sys.stderr)
+        time.sleep(TICK)
+
+
+def start() -> None:
+    """Start the scheduler thread (once per process) unless disabled."""
+    global _started
+    with _lock:
+        if _started or not ENABLED:
+            return
+        _started = True
+    pool = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="overleaf-sync")
+    threading.Thread(target=_run, args=(pool,), name="overleaf-sync-scheduler", daemon=True).start()
+
+
+def record_pull(project_name: str) -> None:
+    """Note that the project was just pulled by hand, so it is no longer stale."""
+    with _lock:
+        state = _state.setdefault(project_name, {})
+        state.update(updated=0, behind=0, stale=False, reason=None, error=None,
+                     synced_at=time.time(), attempted_at=time.time())
+
+
+def status(project_name: str):
+    """Sync state of a project, or None if it has not been fetched in the background yet."""
+    with _lock:
+        state = _state.get(project_name)
+        if not state or ("synced_at" not in state and "error" not in state):
+            return None
+        return dict(state)
+
+
+def describe(project_name: str):
+    """One-line staleness note for tool output, or None when nothing is known."""
+    state = status(project_name)
+    if state is None:
+        return None
+    if state.get("synced_at") is None:
+        return f"[sync: background fetch failed: {state['error']}]"
+    age = time.time() - state["synced_at"]
+    note = f"[sync: fetched {age:.0f}s ago"
+    if state.get("stale"):
+        note += f", STALE: {state['behind']} newer commit(s) on Overleaf not applied ({state['reason']}); run overleaf_pull"
+    elif state.get("error"):
+        note += f", last fetch failed: {state['error']}"
+    else:
+        note += ", up to date"
+    return note + "]"
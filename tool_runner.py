@@ -0,0 +1,57 @@
+"""
+Run blocking tool work (Google API calls, git subprocesses) off the event loop.
+
+The MCP servers declare their tools as async handlers and hand the blocking
+part to run_blocking(), which executes it on a shared bounded thread pool.
+Each backend also has its own concurrency limit, so a burst of calls against
+one service cannot take every worker. Calls are timed and attributed under
+the MCP tool's name, including the time spent waiting for a backend slot.
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Total worker threads shared by all backends
+MAX_WORKERS = 16
+
+# Maximum concurrent calls per backend; unknown backends use DEFAULT_LIMIT
+BACKEND_LIMITS = {
+    "gmail": 6,
+    "calendar": 6,
+    "overleaf": 4,
+}
+DEFAULT_LIMIT = 4
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="alfred-tool")
+_semaphores = {}
+
+
+def _semaphore(backend: str) -> asyncio.Semaphore:
+    # Semaphores bind to the running loop, so they are created lazily inside it
+    sem = _semaphores.get(backend)
+    if sem is None:
+        sem = asyncio.Semaphore(BACKEND_LIMITS.get(backend, DEFAULT_LIMIT))
+        _semaphores[backend] = sem
+    return sem
+
+
+async def run_blocking(backend: str, tool: str, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) on the worker pool, within the backend's concurrency limit.
+
+    tool is the MCP tool name the call's metrics are recorded under.
+    """
+    token = metrics.current_tool.set(tool)
+    try:
+        with metrics.timed("tool", tool):
+            async with _semaphore(backend):
+                loop = asyncio.get_running_loop()
+                # Run in a copy of the caller's context so metrics attribute nested work to this call
+                ctx = contextvars.copy_context()
+                return await loop.run_in_executor(_executor, functools.partial(ctx.run, func, *args, **kwargs))
+    finally:
+        metrics.current_tool.reset(token)